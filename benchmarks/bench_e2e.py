@@ -0,0 +1,418 @@
+"""end-to-end install, verify and update against a local stand-in origin.
+
+    python benchmarks/bench_e2e.py [--mods 150] [--configs 2000] [--assets 3000] [--libraries 20]
+                                   [--latency 30ms] [--bandwidth 20M] [--failure-rate 0.01]
+                                   [--bump 0.1] [--seed 1] [--json]
+
+generates a synthetic package (mods with a log-normal size spread, thousands of small
+configs), a minecraft version with libraries, a client jar and an asset index with
+thousands of objects, builds it with nupdate.build and serves everything from one
+nupdate.serve origin on localhost: packages and objects as usual, resources/ standing in
+for resources.download.minecraft.net and launchermeta/ for mojang's version metadata,
+client and library downloads. every request can be delayed, every body is paced to a
+shared bandwidth cap and a fraction of requests fail with 503.
+
+the client side runs through Modpacks, Modpack and MojangMinecraftJson like a launch:
+
+    cold       empty instance and .minecraft
+    warm       nothing changed, default (warm) verify policies
+    warm_full  nothing changed, everything hashed
+    bump       a new package version with --bump of the mods and configs changed
+
+with --json the results are one object (keyed by the git commit) to diff across commits.
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from nupdate.build import ObjectStore, URLBuilder, build  # noqa: E402
+from nupdate.serve import OriginServer, SEND_CHUNK  # noqa: E402
+
+UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+PACKAGE = "bench"
+MINECRAFT = "bench-1.7.10"
+
+# log-normal (median, sigma, min, max) in bytes; mod jars range from tiny api stubs to
+# tens of megabytes, configs and assets stay small
+MOD_SIZES = (200 << 10, 1.3, 2 << 10, 32 << 20)
+CONFIG_SIZES = (1 << 10, 1.0, 64, 64 << 10)
+ASSET_SIZES = (6 << 10, 1.4, 64, 4 << 20)
+LIBRARY_SIZES = (300 << 10, 1.2, 8 << 10, 8 << 20)
+SHARED_ASSETS = 0.08  # asset names that point at an object another name already has
+CLIENT_SIZE = 5 << 20
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    if text[-1] in UNITS:
+        return int(float(text[:-1]) * UNITS[text[-1]])
+
+    return int(text)
+
+
+def parse_seconds(text):
+    text = text.strip().lower()
+    if text.endswith("ms"):
+        return float(text[:-2]) / 1000
+    elif text.endswith("s"):
+        return float(text[:-1])
+
+    return float(text)
+
+
+def draw_size(rng: random.Random, spec):
+    median, sigma, low, high = spec
+    return int(min(max(rng.lognormvariate(math.log(median), sigma), low), high))
+
+
+def write_blob(path: Path, size):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = os.urandom(size)
+    path.write_bytes(data)
+    return {"sha1": hashlib.sha1(data).hexdigest(), "size": size}
+
+
+class ShapedServer(OriginServer):
+    # the origin with a round trip added to every request, bodies paced to one shared
+    # bandwidth cap and a fraction of requests answered 503
+    variants = ()
+
+    def __init__(self, root: Path, latency=0.0, bandwidth=0, failure_rate=0.0):
+        super().__init__(root)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self.failures = 0
+        self.sent = 0
+        self._free_at = 0.0
+
+    async def _request(self, sock, head):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if self.failure_rate and random.random() < self.failure_rate:
+            self.requests += 1
+            self.failures += 1
+            await self._send(sock, 503, {}, b"", False)
+            return False
+
+        return await super()._request(sock, head)
+
+    async def _pace(self, size):
+        if not self.bandwidth:
+            return
+
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        start = max(now, self._free_at)
+        self._free_at = start + size / self.bandwidth
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def _send(self, sock, status, headers, body, keep_alive, length_set=False):
+        await self._pace(len(body))
+        self.sent += len(body)
+        await super()._send(sock, status, headers, body, keep_alive, length_set)
+
+    async def _sendfile(self, sock, path: Path, offset, count):
+        loop = asyncio.get_event_loop()
+        with path.open('rb') as fp:
+            fp.seek(offset)
+            while count > 0:
+                chunk = await loop.run_in_executor(None, fp.read, min(SEND_CHUNK, count))
+                if not chunk:
+                    break
+                await self._pace(len(chunk))
+                await loop.sock_sendall(sock, chunk)
+                self.sent += len(chunk)
+                count -= len(chunk)
+
+
+def start_server(server: OriginServer):
+    loop = asyncio.new_event_loop()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(server.serve("127.0.0.1", 0))
+
+    threading.Thread(target=run, daemon=True).start()
+    while getattr(server, 'address', None) is None:
+        time.sleep(0.01)
+
+    return server
+
+
+def make_mojang(root: Path, site, rng: random.Random, assets, libraries):
+    # launchermeta/: asset index, client jar, libraries; resources/: asset objects
+    objects = {}
+    for index in range(assets):
+        if objects and rng.random() < SHARED_ASSETS:
+            # another name for an object already listed, as real indexes have
+            objects[f"bench/asset/{index:05d}.ogg"] = dict(rng.choice(list(objects.values())))
+            continue
+
+        size = draw_size(rng, ASSET_SIZES)
+        data = os.urandom(size)
+        sha1 = hashlib.sha1(data).hexdigest()
+        path = root / "resources" / sha1[:2] / sha1
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        objects[f"bench/asset/{index:05d}.ogg"] = {"hash": sha1, "size": size}
+
+    asset_index = json.dumps({"objects": objects}).encode('utf-8')
+    asset_index_path = root / "launchermeta" / "indexes" / f"{PACKAGE}.json"
+    asset_index_path.parent.mkdir(parents=True, exist_ok=True)
+    asset_index_path.write_bytes(asset_index)
+
+    client = write_blob(root / "launchermeta" / "client" / f"{MINECRAFT}.jar", CLIENT_SIZE)
+    library_list = []
+    for index in range(libraries):
+        rpath = f"bench/lib/lib{index}/1.0/lib{index}-1.0.jar"
+        info = write_blob(root / "launchermeta" / "libraries" / rpath, draw_size(rng, LIBRARY_SIZES))
+        library_list.append({
+            "name": f"bench.lib:lib{index}:1.0",
+            "downloads": {"artifact": dict(info, path=rpath, url=f"{site}launchermeta/libraries/{rpath}")},
+        })
+
+    return {
+        "id": MINECRAFT,
+        "jar": MINECRAFT,
+        "type": "release",
+        "mainClass": "net.minecraft.launchwrapper.Launch",
+        "minecraftArguments": "--username ${auth_player_name} --version ${version_name}",
+        "assets": PACKAGE,
+        "assetIndex": {
+            "id": PACKAGE,
+            "sha1": hashlib.sha1(asset_index).hexdigest(),
+            "size": len(asset_index),
+            "url": f"{site}launchermeta/indexes/{PACKAGE}.json",
+        },
+        "downloads": {"client": dict(client, url=f"{site}launchermeta/client/{MINECRAFT}.jar")},
+        "libraries": library_list,
+    }
+
+
+def make_package(folder: Path, rng: random.Random, mods, configs, version_json):
+    (folder / "files").mkdir(parents=True, exist_ok=True)
+    (folder / "minecraft.json").write_text(json.dumps(version_json, indent=2))
+    for index in range(mods):
+        write_blob(folder / "files" / "mods" / f"mod{index:04d}.jar", draw_size(rng, MOD_SIZES))
+    for index in range(configs):
+        write_blob(folder / "files" / "config" / f"mod{index % max(mods, 1):04d}" / f"cfg{index:05d}.cfg",
+                   draw_size(rng, CONFIG_SIZES))
+
+
+def bump_package(folder: Path, rng: random.Random, fraction):
+    # rewrite, add and remove about `fraction` of the files, like a pack update
+    files = sorted(path for path in (folder / "files").rglob("*") if path.is_file())
+    changed = rng.sample(files, max(1, int(len(files) * fraction)))
+    counts = Counter()
+    for path in changed:
+        kind = rng.random()
+        if kind < 0.7:
+            spec = MOD_SIZES if path.suffix == ".jar" else CONFIG_SIZES
+            write_blob(path, draw_size(rng, spec))
+            counts["changed"] += 1
+        elif kind < 0.85:
+            path.unlink()
+            counts["removed"] += 1
+        else:
+            spec = MOD_SIZES if path.suffix == ".jar" else CONFIG_SIZES
+            write_blob(path.with_name("new-" + path.name), draw_size(rng, spec))
+            counts["added"] += 1
+
+    return dict(counts)
+
+
+def tree_stats(folder: Path):
+    files = [path for path in (folder / "files").rglob("*") if path.is_file()]
+    return {"files": len(files), "bytes": sum(path.stat().st_size for path in files)}
+
+
+class Phase:
+    # wall time of each step, requests and bytes the origin served, fetches and checks
+    def __init__(self, server: ShapedServer):
+        self.server = server
+        self.steps = {}
+        self.result = {}
+
+    @contextlib.contextmanager
+    def step(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps[name] = round(time.perf_counter() - start, 4)
+
+    def __enter__(self):
+        from nupdate.trace import enable
+
+        self._requests, self._sent, self._failures = self.server.requests, self.server.sent, self.server.failures
+        self._start = time.perf_counter()
+        self._tracer = enable()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        from nupdate.progress import finish_progress
+        from nupdate.trace import disable
+        from nupdate.utils import clear_session
+
+        finish_progress()
+        clear_session()
+        disable()
+
+        events = Counter(event["cat"] for event in self._tracer.events)
+        self.result = {
+            "seconds": round(time.perf_counter() - self._start, 4),
+            "steps": self.steps,
+            "requests": self.server.requests - self._requests,
+            "bytes": self.server.sent - self._sent,
+            "injected_failures": self.server.failures - self._failures,
+            "fetches": events["download"],
+            "checks": events["verify"],
+        }
+        if exc_type is not None:
+            self.result["error"] = "".join(traceback.format_exception_only(exc_type, exc_val)).strip()
+
+        return exc_type is not None and issubclass(exc_type, Exception)
+
+
+def client_update(phase: Phase, index_url, client: Path, verify=None):
+    from nupdate.main import Modpacks
+    from nupdate.mojang.minecraft import MojangMinecraftPackage
+    from nupdate.verify import configure_policies
+
+    configure_policies({"verify": verify} if verify else None)
+    with phase.step("index"):
+        mps = Modpacks(index_url, client / "Instance")
+    with phase.step("manifest"):
+        mp = mps.package(PACKAGE)
+    with phase.step("package"):
+        mp()
+
+    mc = MojangMinecraftPackage(client / ".minecraft").build(PACKAGE, mp)
+    with phase.step("minecraft"):
+        mc()
+
+
+def run(args):
+    import nupdate.mojang.assets
+
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    work = Path(tempfile.mkdtemp(prefix="bench-e2e-"))
+    web, client = work / "web", work / "client"
+    results = {}
+    try:
+        web.mkdir()
+        server = start_server(ShapedServer(web, args.latency, args.bandwidth, args.failure_rate))
+        site = f"http://127.0.0.1:{server.address[1]}/"
+        nupdate.mojang.assets.MOJANG_RESOURCES_URL = site + "resources/{0}"
+
+        url_builder = URLBuilder(site, web)
+        store = ObjectStore(web / "objects", url_builder)
+        folder = web / "packages" / PACKAGE
+
+        start = time.perf_counter()
+        version_json = make_mojang(web, site, rng, args.assets, args.libraries)
+        make_package(folder, rng, args.mods, args.configs, version_json)
+        generated = time.perf_counter()
+        index_url = build(web / "packages", url_builder, store)['url']
+        results["tree"] = dict(tree_stats(folder), assets=args.assets, libraries=args.libraries,
+                               generate_seconds=round(generated - start, 3),
+                               build_seconds=round(time.perf_counter() - generated, 3))
+
+        phases = {}
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for name, verify in ("cold", None), ("warm", None), ("warm_full", "full"):
+                with Phase(server) as phase:
+                    client_update(phase, index_url, client, verify)
+                phases[name] = phase.result
+
+            bumped = bump_package(folder, rng, args.bump)
+            index_url = build(web / "packages", url_builder, store)['url']
+            with Phase(server) as phase:
+                client_update(phase, index_url, client)
+            phases["bump"] = dict(phase.result, files=bumped)
+
+        results["phases"] = phases
+    finally:
+        if args.keep:
+            print(f"kept {work}", file=sys.stderr)
+        else:
+            shutil.rmtree(str(work), ignore_errors=True)
+
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=str(ROOT), stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mods", type=int, default=150)
+    parser.add_argument("--configs", type=int, default=2000)
+    parser.add_argument("--assets", type=int, default=3000)
+    parser.add_argument("--libraries", type=int, default=20)
+    parser.add_argument("--latency", type=parse_seconds, default=0.03, help="added to every request, e.g. 30ms")
+    parser.add_argument("--bandwidth", type=parse_size, default=20 << 20, help="bytes/s for all clients, 0 for none")
+    parser.add_argument("--failure-rate", type=float, default=0.01, help="fraction of requests answered 503")
+    parser.add_argument("--bump", type=float, default=0.1, help="fraction of files a version bump touches")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep", action="store_true", help="keep the generated trees")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    results = {
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "config": {
+            "mods": args.mods, "configs": args.configs, "assets": args.assets, "libraries": args.libraries,
+            "latency": args.latency, "bandwidth": args.bandwidth, "failure_rate": args.failure_rate,
+            "bump": args.bump, "seed": args.seed,
+        },
+    }
+    results.update(run(args))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    tree = results["tree"]
+    print(f"tree: {tree['files']} files, {tree['bytes'] / (1 << 20):.1f} MiB, {tree['assets']} assets, "
+          f"{tree['libraries']} libraries (built in {tree['build_seconds']:.2f}s)")
+    print(f"{'phase':<10} {'seconds':>8} {'requests':>9} {'MiB':>8} {'fetches':>8} {'checks':>7}  steps")
+    for name, phase in results["phases"].items():
+        steps = " ".join(f"{step}={seconds:.2f}" for step, seconds in phase["steps"].items())
+        print(f"{name:<10} {phase['seconds']:>8.2f} {phase['requests']:>9} {phase['bytes'] / (1 << 20):>8.1f} "
+              f"{phase['fetches']:>8} {phase['checks']:>7}  {steps}")
+        if "error" in phase:
+            print(f"{'':<10} error: {phase['error']}")
+
+    return 0 if all("error" not in phase for phase in results["phases"].values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""compare nupdate.fileio against the previous 4 KiB read loops.
+
+    python benchmarks/bench_fileio.py [--sizes 1K,1M,500M] [--repeat 5] [--dir /tmp] [--json]
+
+hash: calc_sha1_hash (old 4 KiB fp.read loop) vs fileio.hash_file
+copy: shutil.copy vs fileio.copy_file
+stream: writing an in-memory response in 4 KiB chunks vs stream_chunk_size()
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from nupdate.fileio import copy_file, hash_file, stream_chunk_size  # noqa: E402
+
+UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    if text[-1] in UNITS:
+        return int(float(text[:-1]) * UNITS[text[-1]])
+
+    return int(text)
+
+
+def legacy_sha1_hash(path: Path):
+    with path.open('rb') as fp:
+        hobj = hashlib.sha1()
+        buf = True
+        while buf:
+            buf = fp.read(4096)
+            hobj.update(buf)
+
+    return hobj.hexdigest().lower()
+
+
+def legacy_stream(data, path: Path):
+    stream = io.BytesIO(data)
+    with path.open('wb') as fp:
+        for chunk in iter(lambda: stream.read(4096), b''):
+            fp.write(chunk)
+
+
+def adaptive_stream(data, path: Path):
+    stream = io.BytesIO(data)
+    chunk_size = stream_chunk_size(len(data))
+    with path.open('wb') as fp:
+        for chunk in iter(lambda: stream.read(chunk_size), b''):
+            fp.write(chunk)
+
+
+def make_file(path: Path, size):
+    block = os.urandom(min(size, 1 << 20))
+    with path.open('wb') as fp:
+        left = size
+        while left > 0:
+            fp.write(block[:left])
+            left -= len(block)
+
+
+def timeit(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def bench_size(base: Path, size, repeat):
+    src = base / f"src-{size}"
+    dst = base / f"dst-{size}"
+    make_file(src, size)
+    data = src.read_bytes() if size <= (64 << 20) else None
+
+    assert legacy_sha1_hash(src) == hash_file(src)
+
+    cases = {
+        "hash": (lambda: legacy_sha1_hash(src), lambda: hash_file(src)),
+        "copy": (lambda: shutil.copy(str(src), str(dst)), lambda: copy_file(src, dst)),
+    }
+    if data is not None:
+        cases["stream"] = (lambda: legacy_stream(data, dst), lambda: adaptive_stream(data, dst))
+
+    result = {}
+    for name, (old, new) in cases.items():
+        old_time, new_time = timeit(old, repeat), timeit(new, repeat)
+        result[name] = {
+            "old_s": old_time,
+            "new_s": new_time,
+            "old_mb_s": size / old_time / (1 << 20),
+            "new_mb_s": size / new_time / (1 << 20),
+            "speedup": old_time / new_time,
+        }
+
+    src.unlink()
+    if dst.exists():
+        dst.unlink()
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1K,1M,500M")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--dir", default=None)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = {}
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        for text in args.sizes.split(","):
+            size = parse_size(text)
+            repeat = args.repeat if size < (100 << 20) else max(1, args.repeat // 2)
+            report[text] = bench_size(Path(tmp), size, repeat)
+
+    if args.json:
+        print(json.dumps(report, indent=4))
+        return
+
+    for text, cases in report.items():
+        for name, case in cases.items():
+            print(f"{text:>6} {name:<7} old {case['old_mb_s']:>9.1f} MB/s  "
+                  f"new {case['new_mb_s']:>9.1f} MB/s  x{case['speedup']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""measure `python -X importtime` of the launcher entry point.
+
+    python benchmarks/bench_importtime.py [--runs 5] [--max-ms 150] [--json]
+
+exits with 1 when a heavy module is imported at startup or when the median
+cumulative import time of the entry module exceeds --max-ms.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# must only be imported by the phase that needs them
+HEAVY_MODULES = (
+    "requests",
+    "urllib3",
+    "hyper",
+    "certifi",
+    "mojang_api",
+    "paramiko",
+    "webbrowser",
+)
+
+
+def importtime(module=None):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, (str(ROOT), env.get("PYTHONPATH"))))
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}" if module else "pass"],
+        cwd=str(ROOT),
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+
+    if proc.returncode != 0:
+        raise Exception(f"import {module} failed:\n{proc.stderr}")
+
+    result = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+
+        fields = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue  # header
+
+        name = fields[2].strip()
+        result[name] = (self_us, cumulative_us)
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="nupdate.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-ms", type=float, default=None)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    importtime(args.module)  # warm the bytecode cache
+    baseline = importtime()  # site, .pth hooks
+
+    runs = [importtime(args.module) for _ in range(args.runs)]
+    totals = [run[args.module][1] / 1000 for run in runs]
+    median_ms = statistics.median(totals)
+
+    last = runs[-1]
+    heavy = sorted(name for name in last
+                   if name.split(".")[0] in HEAVY_MODULES and name not in baseline)
+    top = sorted(last.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+
+    report = {
+        "module": args.module,
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "median_ms": round(median_ms, 3),
+        "min_ms": round(min(totals), 3),
+        "modules": len(last),
+        "heavy": heavy,
+        "top": [{"name": name, "self_us": s, "cumulative_us": c} for name, (s, c) in top],
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=4))
+    else:
+        print(f"{args.module}: median {report['median_ms']} ms, min {report['min_ms']} ms, "
+              f"{report['modules']} modules ({args.runs} runs)")
+        for item in report["top"]:
+            print(f"  {item['cumulative_us']:>8} us  {item['name']}")
+        if heavy:
+            print("heavy modules imported at startup:", ", ".join(heavy))
+
+    failed = bool(heavy)
+    if args.max_ms is not None and median_ms > args.max_ms:
+        print(f"median {median_ms:.1f} ms exceeds --max-ms {args.max_ms}", file=sys.stderr)
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""load test nupdate.serve on localhost.
+
+    python benchmarks/bench_serve.py [--clients 16] [--seconds 5] [--objects 200] [--size 256K] [--json]
+
+builds a throwaway web root (index.json, modpack.json with .gz siblings, sha1-named objects),
+starts the origin server on an ephemeral port and hammers it with keep-alive clients mixing
+manifest fetches, whole objects, byte ranges and conditional requests. every response is checked.
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import http.client
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from nupdate.serve import OriginServer  # noqa: E402
+
+UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    if text[-1] in UNITS:
+        return int(float(text[:-1]) * UNITS[text[-1]])
+
+    return int(text)
+
+
+def make_root(root: Path, count, size):
+    objects = {}
+    for _ in range(count):
+        data = os.urandom(random.randint(1, size))
+        sha1 = hashlib.sha1(data).hexdigest()
+        path = root / "objects" / sha1[:2] / sha1
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        objects[f"/objects/{sha1[:2]}/{sha1}"] = data
+
+    files = [{'url': f"http://localhost{url}", 'path': f"mods/{index}.jar", 'sha1': url[-40:]}
+             for index, url in enumerate(objects)]
+    manifest = json.dumps({'id': 'bench', 'files': files}).encode('utf-8')
+    (root / "packages" / "bench").mkdir(parents=True)
+    (root / "packages" / "bench" / "modpack.json").write_bytes(manifest)
+    (root / "packages" / "bench" / "modpack.json.gz").write_bytes(gzip.compress(manifest))
+    (root / "packages" / "index.json").write_bytes(json.dumps({'packages': {}}).encode('utf-8'))
+    return objects, manifest
+
+
+def start_server(root: Path):
+    server = OriginServer(root)
+    loop = asyncio.new_event_loop()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(server.serve("127.0.0.1", 0))
+
+    threading.Thread(target=run, daemon=True).start()
+    while getattr(server, 'address', None) is None:
+        time.sleep(0.01)
+
+    return server
+
+
+def client(port, objects, manifest, deadline, stats):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    urls = list(objects)
+    requests = transferred = errors = 0
+
+    while time.perf_counter() < deadline:
+        kind = random.random()
+        url = random.choice(urls)
+        data = objects[url]
+        headers = {}
+        if kind < 0.1:
+            url, expect, status = "/packages/bench/", manifest, 200
+            headers["Accept-Encoding"] = "gzip"
+        elif kind < 0.2:
+            headers["If-None-Match"] = f'"{url[-40:]}"'
+            expect, status = b"", 304
+        elif kind < 0.5:
+            start = random.randrange(len(data))
+            end = random.randrange(start, len(data))
+            headers["Range"] = f"bytes={start}-{end}"
+            expect, status = data[start:end + 1], 206
+        else:
+            expect, status = data, 200
+
+        conn.request("GET", url, headers=headers)
+        response = conn.getresponse()
+        body = response.read()
+        if response.getheader("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+
+        requests += 1
+        transferred += len(body)
+        if response.status != status or body != expect:
+            errors += 1
+
+    conn.close()
+    stats.append((requests, transferred, errors))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--objects", type=int, default=200)
+    parser.add_argument("--size", default="256K", help="largest object")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        objects, manifest = make_root(Path(tmp), args.objects, parse_size(args.size))
+        server = start_server(Path(tmp))
+
+        stats = []
+        deadline = time.perf_counter() + args.seconds
+        threads = [
+            threading.Thread(target=client, args=(server.address[1], objects, manifest, deadline, stats))
+            for _ in range(args.clients)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+    report = {
+        "clients": args.clients,
+        "requests": sum(item[0] for item in stats),
+        "bytes": sum(item[1] for item in stats),
+        "errors": sum(item[2] for item in stats),
+        "seconds": elapsed,
+    }
+    report["req_s"] = report["requests"] / elapsed
+    report["mb_s"] = report["bytes"] / elapsed / (1 << 20)
+
+    if args.json:
+        print(json.dumps(report, indent=4))
+    else:
+        print(f"{report['requests']} requests from {args.clients} clients in {elapsed:.1f}s: "
+              f"{report['req_s']:.0f} req/s, {report['mb_s']:.1f} MB/s, {report['errors']} errors")
+
+    if report["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
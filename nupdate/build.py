@@ -1,17 +1,69 @@
 import datetime
+import gzip
 import hashlib
+import io
 import json
 import os
 import shutil
+import sys
 import tempfile
-import zipapp
+import time
+import zipfile
 from pathlib import Path
 from pprint import pprint
 
 from nupdate import LAUNCHER_VERSION
+from nupdate.fileio import copy_file, hash_file_multi
+from nupdate.hashes import hash_available, new_hash
+from nupdate.manifest import build_tree
 from nupdate.mojang.library import MavenDownload
 from nupdate.mojang.minecraft import MojangMinecraftJson, MojangMinecraftPackage
-from nupdate.utils import calc_sha1_hash, Namespace
+from nupdate.trace import span
+from nupdate.utils import Namespace
+
+
+# sha1 is always emitted; older launchers and mojang-style entries only know it
+MANIFEST_HASHES = ('sha1',)
+# part of every package digest; bump it when modpack.json gains a field (like "tree"),
+# so unchanged packages are rebuilt with it once
+MANIFEST_FORMAT = 2
+
+
+def manifest_hashes(names=None):
+    names = ('sha1', *(name for name in names or MANIFEST_HASHES if name != 'sha1'))
+    for name in names:
+        if not hash_available(name):
+            raise Exception(f"hash algorithm {name!r} unavailable")
+
+    return names
+
+
+def hash_info(path: Path, hashes):
+    info = hash_file_multi(path, hashes)
+    info['size'] = path.stat().st_size
+    return info
+
+
+class DigestCache:
+    # path => hash_info, reused while size and mtime hold; long running builds
+    # (watch mode) then only hash what changed
+    def __init__(self):
+        self._entries = {}
+
+    def hash_info(self, path: Path, hashes):
+        stat = path.stat()
+        key = stat.st_size, stat.st_mtime_ns, tuple(hashes)
+        entry = self._entries.get(path)
+        if entry is None or entry[0] != key:
+            info = hash_file_multi(path, hashes)
+            info['size'] = stat.st_size
+            entry = self._entries[path] = key, info
+
+        return dict(entry[1])  # callers add bundle offsets to it
+
+    def forget(self, folder: Path):
+        for path in [path for path in self._entries if folder in path.parents]:
+            del self._entries[path]
 
 
 def current_date():
@@ -22,7 +74,8 @@ def current_time():
     return datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S+0000")
 
 
-def minecraft_build(mc_version, forge_version, path_lib: Path, url_builder) -> MojangMinecraftJson:
+def minecraft_build(mc_version, forge_version, path_lib: Path, url_builder, hashes=MANIFEST_HASHES,
+                    store: "ObjectStore" = None) -> MojangMinecraftJson:
     mm = MojangMinecraftPackage(Path(os.environ["APPDATA"]) / '.minecraft')
     name = f'{mc_version}-{forge_version}'
 
@@ -50,17 +103,18 @@ def minecraft_build(mc_version, forge_version, path_lib: Path, url_builder) -> M
             target = path_lib / rpath
             target.parent.mkdir(parents=True, exist_ok=True)
 
-            shutil.copy(source, target)
-
-            file_sha1_hash = calc_sha1_hash(target)
-            file_size = target.stat().st_size
+            copy_file(source, target)
 
             artifact = library.setdefault('downloads', {}).setdefault('artifact', {})
+            if store is None:
+                info = dict(hash_info(target, manifest_hashes(hashes)), url=url_builder(target))
+            else:
+                info = store.publish_info(target, manifest_hashes(hashes))
+            url = info.pop('url')
+            artifact.update(info)
             artifact.update({
-                'sha1': file_sha1_hash,
-                'size': file_size,
                 'path': str(rpath.as_posix()),
-                'url': url_builder(target),
+                'url': url,
             })
 
     return mc_pack
@@ -76,10 +130,29 @@ def render_json(data):
     return content
 
 
-def as_content(data, path: Path, base: Path, url_builder):
+def as_content(data, path: Path, base: Path, url_builder, hashes=MANIFEST_HASHES):
     content = render_json(data)
     (base / path).write_bytes(content)
+    write_precompressed(base / path, content)
+    return content_info(content, path, base, url_builder, hashes)
 
+
+def write_precompressed(path: Path, content: bytes):
+    # siblings the serve command negotiates with Accept-Encoding; mtime=0 keeps rebuilds byte-identical
+    buffer = io.BytesIO()
+    with gzip.GzipFile(filename="", mode='wb', fileobj=buffer, mtime=0) as fp:
+        fp.write(content)
+    path.with_name(path.name + ".gz").write_bytes(buffer.getvalue())
+
+    try:
+        import brotli
+    except ImportError:
+        return
+
+    path.with_name(path.name + ".br").write_bytes(brotli.compress(content))
+
+
+def content_info(content: bytes, path: Path, base: Path, url_builder, hashes=MANIFEST_HASHES):
     if path.name in ("index.json", "modpack.json"):
         urlpath = path.parent
         tail = "/"
@@ -87,26 +160,34 @@ def as_content(data, path: Path, base: Path, url_builder):
         urlpath = path
         tail = ""
 
-    return {
+    info = {
         'url': url_builder(urlpath) + tail,
         'path': path.relative_to(base).as_posix(),
-        'sha1': hashlib.sha1(content).hexdigest().lower(),
-        'size': len(content),
     }
 
+    for name in manifest_hashes(hashes):
+        hobj = new_hash(name)
+        hobj.update(content)
+        info[name] = hobj.hexdigest().lower()
 
-def build_files(path: Path, url_builder):
+    info['size'] = len(content)
+    return info
+
+
+def build_files(path: Path, url_builder, hashes=MANIFEST_HASHES, store: "ObjectStore" = None,
+                cache: "DigestCache" = None):
+    hashes = manifest_hashes(hashes)
     files = []
-    for file in path.glob("**/*"):  # type: Path
+    for file in sorted(path.glob("**/*")):  # type: Path
         if file.is_file():
-            file_size = file.stat().st_size
-            file_sha1_hash = calc_sha1_hash(file)
             file_info = {
                 'url': url_builder(file),
                 'path': file.relative_to(path).as_posix(),
-                'sha1': file_sha1_hash,
-                'size': file_size,
             }
+            if store is None:
+                file_info.update(hash_info(file, hashes) if cache is None else cache.hash_info(file, hashes))
+            else:
+                file_info.update(store.publish_info(file, hashes, cache))
 
             files.append(file_info)
 
@@ -115,8 +196,106 @@ def build_files(path: Path, url_builder):
     }
 
 
-def build_package(id_, name, version, path: Path, mc_pack: MojangMinecraftJson, url_builder):
-    now = current_time()
+BUNDLE_THRESHOLD = 4096  # files up to this size are bundled
+BUNDLE_MIN_FILES = 4
+BUNDLE_MAX_SIZE = 8 << 20
+
+
+def bundle_key(path: str):
+    # one bundle group per directory, at most two levels deep (config/<modid>)
+    parent = path.rpartition('/')[0]
+    return '/'.join(parent.split('/')[:2])
+
+
+def build_bundles(path: Path, files, url_builder, store: "ObjectStore" = None, threshold=BUNDLE_THRESHOLD):
+    # plain concatenation, so an entry is the byte range [offset, offset + size)
+    # of its bundle; adds 'bundle' and 'offset' to the bundled file entries
+    groups = {}
+    for info in files:
+        if info['size'] <= threshold:
+            groups.setdefault(bundle_key(info['path']), []).append(info)
+
+    bundles = []
+    bundle_dir = path / 'bundles'
+    for key, infos in sorted(groups.items()):
+        if len(infos) < BUNDLE_MIN_FILES:
+            continue
+
+        batches = [[]]
+        batch_size = 0
+        for info in infos:
+            if batch_size + info['size'] > BUNDLE_MAX_SIZE and batches[-1]:
+                batches.append([])
+                batch_size = 0
+
+            batches[-1].append(info)
+            batch_size += info['size']
+
+        for batch in batches:
+            content = b''.join((path / 'files' / info['path']).read_bytes() for info in batch)
+            sha1 = hashlib.sha1(content).hexdigest()
+            if store is not None:
+                url = store.publish_bytes(content, sha1)
+            else:
+                bundle_dir.mkdir(exist_ok=True)
+                bundle_path = bundle_dir / f'{sha1}.bin'
+                if not bundle_path.exists():
+                    bundle_path.write_bytes(content)
+                url = url_builder(bundle_path)
+
+            offset = 0
+            for info in batch:
+                info['bundle'] = len(bundles)
+                info['offset'] = offset
+                offset += info['size']
+
+            bundles.append({
+                'url': url,
+                'dir': key,
+                'sha1': sha1,
+                'size': len(content),
+            })
+
+    if bundle_dir.exists():
+        used = {bundle['sha1'] + '.bin' for bundle in bundles}
+        for stale in bundle_dir.iterdir():
+            if stale.name not in used:
+                stale.unlink()
+
+    return bundles
+
+
+def package_digest(id_, name, mc_pack: MojangMinecraftJson, files, hashes=MANIFEST_HASHES,
+                   bundle_threshold=BUNDLE_THRESHOLD):
+    # everything that ends up in modpack.json except version and times
+    hobj = new_hash('sha1')
+    hobj.update(render_json({
+        'format': MANIFEST_FORMAT,
+        'id': id_,
+        'name': name,
+        'hashes': list(manifest_hashes(hashes)),
+        'bundle_threshold': bundle_threshold,
+        'minecraft': mc_pack,
+        'files': files,
+    }))
+    return hobj.hexdigest().lower()
+
+
+def existing_package(path: Path, url_builder, hashes=MANIFEST_HASHES):
+    modpack_file = path / 'modpack.json'
+    content = modpack_file.read_bytes()
+    data = json.loads(content.decode('utf-8'))
+
+    pack_info = {key: data.get(key) for key in ('name', 'version', 'time')}
+    pack_info.update(content_info(content, modpack_file, path, url_builder, hashes))
+    return pack_info
+
+
+def build_package(id_, name, version, path: Path, mc_pack: MojangMinecraftJson, url_builder,
+                  hashes=MANIFEST_HASHES, files=None, now=None, store: "ObjectStore" = None,
+                  bundle_threshold=BUNDLE_THRESHOLD):
+    if now is None:
+        now = current_time()
 
     basic_info = {
         'name': name,
@@ -131,7 +310,13 @@ def build_package(id_, name, version, path: Path, mc_pack: MojangMinecraftJson,
 
     mc_pack = mc_pack.copy()
     mc_pack.update(basic_info)
-    mc_pack.update(build_files(path / "files", url_builder))
+    if files is None:
+        files = build_files(path / "files", url_builder, hashes, store)
+
+    mc_pack.update(files)
+    mc_pack['tree'] = build_tree(files['files'])
+    if bundle_threshold:
+        mc_pack['bundles'] = build_bundles(path, files['files'], url_builder, store, bundle_threshold)
     mc_pack.update(detail_info)
 
     pack_detail_info = as_content(
@@ -139,6 +324,7 @@ def build_package(id_, name, version, path: Path, mc_pack: MojangMinecraftJson,
         (path / Path('modpack.json')),
         path,
         url_builder,
+        hashes,
     )
 
     pack_info = basic_info.copy()
@@ -147,71 +333,102 @@ def build_package(id_, name, version, path: Path, mc_pack: MojangMinecraftJson,
     return pack_info
 
 
-def build(path, url_builder):
-    packages = {}
-    for folder in path.iterdir():  # type: Path
-        # TODO: update with target modpack only?
-        if folder.is_dir():
-            info_file = (folder / 'info.txt')
-            if info_file.exists():
-                info = json.loads(info_file.read_text())
-            else:
-                info = {}
+def build_folder(folder: Path, url_builder, store: "ObjectStore" = None, cache: "DigestCache" = None):
+    info_file = (folder / 'info.txt')
+    if info_file.exists():
+        info = json.loads(info_file.read_text())
+    else:
+        info = {}
 
-            path_lib = (folder / 'libraries')
+    path_lib = (folder / 'libraries')
 
-            pkg_id = info['id'] = folder.name.lower()  # type: str
+    pkg_id = info['id'] = folder.name.lower()  # type: str
+    hashes = info.get('hashes', MANIFEST_HASHES)  # e.g. ["sha1", "blake2b"]
 
-            mc_file = (folder / 'minecraft.json')
-            if mc_file.exists():
-                mps = MojangMinecraftPackage(Path.cwd())
-                mc_pack = mps.build(pkg_id, json.loads(mc_file.read_text()))
-            else:
-                mc_pack = minecraft_build(
-                    info['mc_version'],  # '1.10.2'
-                    info['forge_version'],  # 'forge1.10.2-12.18.3.2511'
-                    path_lib,
-                    url_builder,
-                )
-
-                as_content(mc_pack, mc_file, folder, url_builder)
-
-            version = info.get('version', current_date())
-            dt, sep, idx = version.partition("-")
-
-            if sep:
-                if dt == current_date():
-                    idx = int(idx) + 1
-                else:
-                    dt = current_date()
-                    idx = 0
-            elif dt == current_date():
-                idx = 0
-
-            info['version'] = f'{dt}-{idx}'
-
-            pkg = build_package(
-                pkg_id,
-                info.setdefault('name', pkg_id.capitalize()),
-                info.setdefault('version', None),
-                folder,
-                mc_pack,
+    mc_file = (folder / 'minecraft.json')
+    if mc_file.exists():
+        mps = MojangMinecraftPackage(Path.cwd())
+        mc_pack = mps.build(pkg_id, json.loads(mc_file.read_text()))
+    else:
+        with span("minecraft", "build", package=pkg_id):
+            mc_pack = minecraft_build(
+                info['mc_version'],  # '1.10.2'
+                info['forge_version'],  # 'forge1.10.2-12.18.3.2511'
+                path_lib,
                 url_builder,
+                hashes,
+                store,
             )
 
-            info['time'] = current_time()
-            info_file.write_text(json.dumps(info, indent=4))
+        as_content(mc_pack, mc_file, folder, url_builder)
+
+    name = info.setdefault('name', pkg_id.capitalize())
+    with span("files", "build", package=pkg_id) as files_span:
+        files = build_files(folder / "files", url_builder, hashes, store, cache)
+        files_span.set(count=len(files['files']))
+    bundle_threshold = info.get('bundle_threshold', BUNDLE_THRESHOLD)
+    digest = package_digest(pkg_id, name, mc_pack, files, hashes, bundle_threshold)
+
+    # unchanged content keeps its version, time and modpack.json, so clients do nothing
+    if info.get('digest') == digest and (folder / 'modpack.json').exists():
+        return existing_package(folder, url_builder, hashes)
+
+    version = info.get('version', current_date())
+    dt, sep, idx = version.partition("-")
+
+    if sep:
+        if dt == current_date():
+            idx = int(idx) + 1
+        else:
+            dt = current_date()
+            idx = 0
+    elif dt == current_date():
+        idx = 0
+
+    info['version'] = f'{dt}-{idx}'
+    info['time'] = current_time()
+    info['digest'] = digest
+
+    with span("manifest", "build", package=pkg_id):
+        pkg = build_package(
+            pkg_id,
+            name,
+            info['version'],
+            folder,
+            mc_pack,
+            url_builder,
+            hashes,
+            files,
+            info['time'],
+            store,
+            bundle_threshold,
+        )
 
-            assert pkg_id not in packages
-            packages[pkg_id] = pkg
+    info_file.write_text(json.dumps(info, indent=4))
+    return pkg
 
+
+def build_index(path: Path, url_builder, packages):
     data = {
         'version': '1.0',
         'time': current_time(),
         'launcher': LAUNCHER_INFO,
-        'packages': packages,
+        'packages': dict(sorted(packages.items())),
     }
 
+    # {origin prefix: [mirror prefix, ...]}, e.g. {"https://mc.nyang.kr/": ["https://mirror.example/"]}
+    mirrors_file = path / 'mirrors.txt'
+    if mirrors_file.exists():
+        data['mirrors'] = json.loads(mirrors_file.read_text())
+
+    try:
+        previous = from_content(path / 'index.json')
+    except (FileNotFoundError, ValueError):
+        previous = None
+
+    if previous and all(previous.get(key) == data.get(key) for key in ('version', 'launcher', 'packages', 'mirrors')):
+        data['time'] = previous.get('time', data['time'])
+
     return as_content(
         data,
         path / 'index.json',
@@ -220,6 +437,19 @@ def build(path, url_builder):
     )
 
 
+def build(path, url_builder, store: "ObjectStore" = None, cache: "DigestCache" = None):
+    packages = {}
+    for folder in path.iterdir():  # type: Path
+        if folder.is_dir():
+            pkg_id = folder.name.lower()
+            assert pkg_id not in packages
+            with span("package", "build", package=pkg_id):
+                packages[pkg_id] = build_folder(folder, url_builder, store, cache)
+
+    with span("index", "build"):
+        return build_index(path, url_builder, packages)
+
+
 class URLBuilder:
     def __init__(self, prefix, root):
         assert prefix.endswith("/")
@@ -230,28 +460,152 @@ class URLBuilder:
         return (self.prefix + path.relative_to(self.root).as_posix())
 
 
+PUBLISH_ATTEMPTS = 3
+
+
+class SourceChanged(Exception):
+    pass
+
+
+class ObjectStore:
+    # sha1-addressed copies (objects/ab/abcdef...) shared by every package; an
+    # object url never changes content, so it can be cached forever
+    def __init__(self, root: Path, url_builder):
+        self.root = root
+        self.url_builder = url_builder
+
+    def path_for(self, sha1: str) -> Path:
+        return self.root / sha1[:2] / sha1
+
+    def publish(self, file: Path, sha1: str) -> str:
+        target = self.path_for(sha1)
+        if not target.exists():
+            # copied, not linked: sftp uploads rewrite package files in place
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tpath = target.with_name(target.name + '.part')
+            copy_file(file, tpath)
+            # the copy is what gets served for a year under this name, so it is what
+            # has to match; the source may have been rewritten since it was hashed
+            if hash_file_multi(tpath, ('sha1',))['sha1'] != sha1:
+                tpath.unlink()
+                raise SourceChanged(file)
+            os.replace(str(tpath), str(target))
+
+        return self.url_builder(target)
+
+    def publish_info(self, file: Path, hashes, cache: "DigestCache" = None) -> dict:
+        # hash_info of file plus its object url; hashed again while it changes under the copy
+        for attempt in range(PUBLISH_ATTEMPTS):
+            info = cache.hash_info(file, hashes) if cache is not None and not attempt else hash_info(file, hashes)
+            try:
+                info['url'] = self.publish(file, info['sha1'])
+            except SourceChanged:
+                continue
+
+            return info
+
+        raise SourceChanged(f"{file} kept changing while it was published")
+
+    def publish_bytes(self, content: bytes, sha1: str) -> str:
+        target = self.path_for(sha1)
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tpath = target.with_name(target.name + '.part')
+            tpath.write_bytes(content)
+            os.replace(str(tpath), str(target))
+
+        return self.url_builder(target)
+
+
 LAUNCHER_INFO = {
     'version': LAUNCHER_VERSION,
     'url': "https://mc.nyang.kr/launcher/",
 }
 
 
-def build_pyz():
-    dir = tempfile.mkdtemp()
-    try:
-        pkg_path = Path(__file__).parent
-        shutil.copytree(pkg_path, os.path.join(dir, pkg_path.name))
-        path = pkg_path.with_name(pkg_path.name + '.pyz')
-        zipapp.create_archive(
-            dir,
-            target=path,
-            main="nupdate.build:build_main",
-            interpreter="/usr/bin/env python3.6",
-        )
+PYZ_INTERPRETER = "/usr/bin/env python3.6"
+PYZ_PYTHON = (3, 6)  # bytecode is only shipped when building with this version
+PYZ_OPTIMIZE = 0  # -O would strip the asserts build() relies on
+PYZ_DATE = (1980, 1, 1, 0, 0, 0)  # the zip epoch; every entry gets it
+PYZ_MAIN = b"# -*- coding: utf-8 -*-\nimport nupdate.build\nnupdate.build.build_main()\n"
+PYZ_COMMENT = b"nupdate-src:"
+
+
+def pyz_sources(pkg_path: Path):
+    return sorted(
+        path for path in pkg_path.rglob("*")
+        if path.is_file() and "__pycache__" not in path.parts and path.suffix not in (".pyc", ".pyo")
+    )
+
+
+def pyz_digest(pkg_path: Path, sources, with_bytecode):
+    hobj = hashlib.sha1()
+    hobj.update(f"{PYZ_INTERPRETER}\n{PYZ_OPTIMIZE}\n".encode('utf-8'))
+    if with_bytecode:
+        hobj.update(sys.version.encode('utf-8'))
+
+    for path in sources:
+        hobj.update(path.relative_to(pkg_path.parent).as_posix().encode('utf-8') + b"\0")
+        hobj.update(hashlib.sha1(path.read_bytes()).digest())
+
+    return hobj.hexdigest()
+
+
+def compile_pyc(source: Path, dfile: str, workdir: Path):
+    # compiled from a copy stamped with PYZ_DATE: the pyc header then matches the zip
+    # entry of its .py (zipimport compares them)
+    import py_compile
+
+    tpath = workdir / "source.py"
+    tpath.write_bytes(source.read_bytes())
+    mtime = time.mktime(PYZ_DATE + (0, 0, -1))
+    os.utime(str(tpath), (mtime, mtime))
 
-        return Path(path)
-    finally:
-        shutil.rmtree(dir, ignore_errors=True)
+    cfile = workdir / "source.pyc"
+    py_compile.compile(str(tpath), str(cfile), dfile, doraise=True, optimize=PYZ_OPTIMIZE)
+    return cfile.read_bytes()
+
+
+def build_pyz(force=False):
+    pkg_path = Path(__file__).parent
+    path = pkg_path.with_name(pkg_path.name + '.pyz')
+
+    sources = pyz_sources(pkg_path)
+    with_bytecode = sys.version_info[:2] == PYZ_PYTHON
+    comment = PYZ_COMMENT + pyz_digest(pkg_path, sources, with_bytecode).encode('ascii')
+
+    # same sources, same archive: keep the file (and its mtime) so uploads skip it
+    if not force and path.exists():
+        try:
+            with zipfile.ZipFile(str(path)) as zf:
+                if zf.comment == comment:
+                    return path
+        except zipfile.BadZipFile:
+            pass
+
+    def add(zf, name, data):
+        zinfo = zipfile.ZipInfo(name, PYZ_DATE)
+        zinfo.create_system = 3
+        zinfo.external_attr = 0o644 << 16
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        zf.writestr(zinfo, data)
+
+    tpath = path.with_name(path.name + '.part')
+    with tempfile.TemporaryDirectory() as workdir, tpath.open('wb') as fp:
+        fp.write(b"#!" + PYZ_INTERPRETER.encode('utf-8') + b"\n")
+        with zipfile.ZipFile(fp, 'w') as zf:
+            add(zf, "__main__.py", PYZ_MAIN)
+            for source in sources:
+                name = source.relative_to(pkg_path.parent).as_posix()
+                add(zf, name, source.read_bytes())
+                if with_bytecode and source.suffix == ".py":
+                    add(zf, name + "c", compile_pyc(source, name, Path(workdir)))
+
+            zf.comment = comment
+
+    os.chmod(str(tpath), 0o755)
+    os.replace(str(tpath), str(path))
+    return path
 
 
 def build_mcjson():
@@ -263,12 +617,49 @@ def build_mcjson():
     (Path.cwd() / "minecraft.json").write_bytes(content)
 
 
-def build_main():
-    site = "https://mc.nyang.kr/"
-    root = Path("/home/signet/web/")
+def build_main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["serve"]:
+        from nupdate.serve import serve_main
+        return serve_main(argv[1:])
+    if argv[:1] == ["collect"]:
+        from nupdate.telemetry import collect_main
+        return collect_main(argv[1:])
+
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="build")
+    parser.add_argument("command", nargs="?", choices=("build", "watch"), default="build",
+                        help="watch: stay running and rebuild packages as their files change")
+    parser.add_argument("--site", default="https://mc.nyang.kr/")
+    parser.add_argument("--root", default="/home/signet/web/", help="web root holding packages/")
+    parser.add_argument("--trace", metavar="PATH", help="write a chrome trace of the build and print a summary")
+    parser.add_argument("--profile", metavar="SPAN", help="with --trace: run cProfile over the first such span")
+    args = parser.parse_args(argv)
+
+    site = args.site
+    root = Path(args.root)
     url_builder = URLBuilder(site, root)
+    store = ObjectStore(root / "objects", url_builder)
     path = root / "packages"
-    result = build(path, url_builder)
+    if args.command == "watch":
+        from nupdate.watch import BuildWatcher
+
+        return BuildWatcher(path, url_builder, store).run()
+
+    if args.trace:
+        from nupdate.trace import disable, enable
+
+        enable(args.profile)
+        try:
+            result = build(path, url_builder, store)
+        finally:
+            tracer = disable()
+            tracer.write(Path(args.trace))
+            print(tracer.summary())
+    else:
+        result = build(path, url_builder, store)
+
     print(result['url'])
 
 
@@ -0,0 +1,90 @@
+import os
+from typing import TYPE_CHECKING
+
+from nupdate.hashes import negotiate, new_hash
+from nupdate.utils import fetch_bytes
+
+if TYPE_CHECKING:
+    from nupdate.journal import UpdateJournal
+
+RANGE_GAP = 64 << 10  # ranges closer than this are fetched as one
+WHOLE_RATIO = 0.5  # fetch the whole bundle once this share of it is needed
+
+
+def coalesce(entries):
+    # entries: (fetchable, basepath) sorted by offset => [(start, end, entries)]
+    ranges = []
+    for entry in entries:
+        fetchable = entry[0]
+        start = int(fetchable['offset'])
+        end = start + int(fetchable['size'])
+        if ranges and start - ranges[-1][1] <= RANGE_GAP:
+            ranges[-1][1] = max(ranges[-1][1], end)
+            ranges[-1][2].append(entry)
+        else:
+            ranges.append([start, end, [entry]])
+
+    return ranges
+
+
+def write_entry(entry, content: bytes):
+    fetchable, basepath = entry
+    hashes = fetchable.hashes
+    if hashes:
+        name = negotiate(hashes)
+        if name is None:
+            return False
+
+        hobj = new_hash(name)
+        hobj.update(content)
+        if hobj.hexdigest().lower() != hashes[name].lower():
+            return False
+
+    path = basepath / fetchable.path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tpath = path.with_name(path.name + '.part')
+    tpath.write_bytes(content)
+    os.replace(str(tpath), str(path))
+    return True
+
+
+def fetch_bundled(bundles, entries, journal: "UpdateJournal" = None):
+    # serves entries that live in a bundle from it (whole or by byte ranges);
+    # returns the entries left for a regular per-file fetch
+    groups = {}
+    left = []
+    for entry in entries:
+        index = entry[0].get('bundle')
+        if index is None or not 0 <= index < len(bundles):
+            left.append(entry)
+        else:
+            groups.setdefault(index, []).append(entry)
+
+    for index, group in sorted(groups.items()):
+        bundle = bundles[index]
+        group.sort(key=lambda item: int(item[0]['offset']))
+
+        needed = sum(int(fetchable['size']) for fetchable, _ in group)
+        if needed >= bundle['size'] * WHOLE_RATIO:
+            ranges = [[0, bundle['size'], group]]
+        else:
+            ranges = coalesce(group)
+
+        for start, end, range_entries in ranges:
+            try:
+                offset, content = fetch_bytes(bundle['url'], start, end)
+            except Exception:
+                left.extend(range_entries)
+                continue
+
+            for entry in range_entries:
+                fetchable, basepath = entry
+                begin = int(fetchable['offset']) - offset
+                data = content[begin:begin + int(fetchable['size'])]
+                if len(data) != int(fetchable['size']) or not write_entry(entry, data):
+                    left.append(entry)
+                elif journal is not None:
+                    from nupdate.journal import FETCHED
+                    journal.record(FETCHED, basepath / fetchable.path, fetchable.path)
+
+    return left
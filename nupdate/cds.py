@@ -0,0 +1,100 @@
+import hashlib
+import os
+import struct
+from pathlib import Path
+
+from nupdate.jvm import java_home, java_version
+
+# -XX:ArchiveClassesAtExit (dynamic archives on top of the jdk's default one) needs 13+;
+# older runtimes, mojang's bundled 8 among them, simply launch without an archive
+DYNAMIC_ARCHIVE_MAJOR = 13
+ARCHIVE_SUFFIX = ".jsa"
+TRAINING_SUFFIX = ".jsa.part"
+ARCHIVE_MAGICS = (0xf00baba2, 0xf00baba8)  # static, dynamic
+
+
+def archive_key(java: Path, classpath):
+    # anything that makes the jvm reject an archive: the runtime build and every
+    # classpath entry, in order (name, size, mtime stand in for content)
+    version = java_version(java)
+    hobj = hashlib.sha1()
+    hobj.update(f"{java_home(java).resolve()}\n{version.version}\n".encode('utf-8'))
+    modules = java_home(java) / "lib" / "modules"
+    if modules.exists():
+        stat = modules.stat()
+        hobj.update(f"modules {stat.st_size} {stat.st_mtime_ns}\n".encode('utf-8'))
+
+    for entry in classpath:
+        try:
+            stat = os.stat(str(entry))
+        except OSError:
+            stat = None
+
+        line = f"{entry} {stat.st_size} {stat.st_mtime_ns}" if stat else f"{entry} -"
+        hobj.update(line.encode('utf-8', 'surrogateescape') + b"\n")
+
+    return hobj.hexdigest()
+
+
+def valid_archive(path: Path):
+    try:
+        with path.open('rb') as fp:
+            header = fp.read(4)
+    except OSError:
+        return False
+
+    return len(header) == 4 and struct.unpack("<I", header)[0] in ARCHIVE_MAGICS
+
+
+class ClassDataArchive:
+    # one archive per (runtime, classpath) in <instance>/cds: the first launch trains it
+    # (the jvm writes it when minecraft exits), the next one that follows a clean exit
+    # promotes it, and every later launch maps it
+    def __init__(self, folder: Path, java: Path, classpath):
+        self.folder = folder
+        self.version = java_version(java)
+        self.key = archive_key(java, classpath) if self.supported else None
+
+    @property
+    def supported(self):
+        return self.version is not None and self.version.major >= DYNAMIC_ARCHIVE_MAJOR
+
+    @property
+    def path(self) -> Path:
+        return self.folder / (self.key + ARCHIVE_SUFFIX)
+
+    @property
+    def training_path(self) -> Path:
+        return self.folder / (self.key + TRAINING_SUFFIX)
+
+    def prepare(self, last_launch_ok=True):
+        # => (jvm options, state) with state one of unsupported/training/mapped
+        if not self.supported:
+            return [], "unsupported"
+
+        self.folder.mkdir(parents=True, exist_ok=True)
+        if not last_launch_ok:
+            self.discard()  # suspect the archive too; train again
+
+        training = self.training_path
+        if training.exists():
+            if valid_archive(training):
+                os.replace(str(training), str(self.path))
+            else:
+                training.unlink()
+
+        # archives of other classpaths or runtimes can never be mapped again
+        for stale in self.folder.iterdir():
+            if stale.name not in (self.path.name, training.name):
+                stale.unlink()
+
+        if self.path.exists():
+            # -Xshare:auto: a rejected archive costs a warning, never the launch
+            return [f"-XX:SharedArchiveFile={self.path}", "-Xshare:auto"], "mapped"
+
+        return [f"-XX:ArchiveClassesAtExit={training}"], "training"
+
+    def discard(self):
+        for path in self.path, self.training_path:
+            if path.exists():
+                path.unlink()
@@ -1,3 +1,8 @@
 MOJANG_CLIENT_URL = "https://s3.amazonaws.com/Minecraft.Download/versions/{0}/{0}.jar"
 MOJANG_RESOURCES_URL = "http://resources.download.minecraft.net/{0}"
+# origin prefix => prefixes serving the same paths; see nupdate.mirrors
+MIRRORS = {
+    "http://resources.download.minecraft.net/": ["https://resources.download.minecraft.net/"],
+}
+
 OS_NAME = 'windows'
@@ -0,0 +1,320 @@
+import argparse
+import contextlib
+import json
+import os
+import secrets
+import socket
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+
+STATE_FILE = "daemon.json"  # port, token and pid of the resident launcher for a folder
+CONNECT_TIMEOUT = 2
+POLL_INTERVAL = 30.0  # where inotify is missing; trusted() compares stats anyway
+OWN_WRITE_WINDOW = 2.0  # an event this soon after a record with the same stat is the write itself
+
+
+class DirtyTracker:
+    # the verified-file state a resident launcher keeps between launches: path =>
+    # (sha1, strongest policy passed, size, mtime). watchers over the trees drop a record
+    # as soon as its file changes, so the next launch checks only what was touched.
+    def __init__(self, roots, log=print):
+        self.roots = [Path(root) for root in roots]
+        self.log = log
+        self.records = {}
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        from nupdate.watch import make_watcher
+
+        for root in self.roots:
+            if not root.is_dir():
+                continue
+
+            watcher = make_watcher(root, POLL_INTERVAL)
+            threading.Thread(target=self._watch, args=(root, watcher), name=f"watch-{root.name}",
+                             daemon=True).start()
+            self.log(f"I: watching {root} ({type(watcher).__name__})")
+
+    def _watch(self, root: Path, watcher):
+        while True:
+            changed = watcher.poll(POLL_INTERVAL)
+            if changed:
+                self.invalidate(root, changed)
+
+    def invalidate(self, root: Path, changed):
+        now = time.monotonic()
+        with self._lock:
+            if root in changed:  # events were lost: nothing under root is known anymore
+                for path in [path for path in self.records if root in path.parents]:
+                    del self.records[path]
+                return
+
+            for path in changed:
+                record = self.records.get(path)
+                if record is None:
+                    continue
+
+                if now - record[4] < OWN_WRITE_WINDOW and record[2:4] == _signature(path):
+                    continue
+
+                del self.records[path]
+
+    def trusted(self, path: Path, sha1, policy):
+        from nupdate.verify import POLICIES
+
+        if not sha1:
+            return False
+
+        with self._lock:
+            record = self.records.get(path)
+
+        if record is None or record[0] != sha1 or record[1] < POLICIES.index(policy.name):
+            return False
+
+        # a change the watcher has not reported yet (polling lags) still shows in the stat
+        if record[2:4] != _signature(path):
+            return False
+
+        with self._lock:
+            self.hits += 1
+
+        return True
+
+    def verified(self, path: Path, sha1, policy):
+        from nupdate.verify import POLICIES
+
+        signature = _signature(path)
+        if not sha1 or signature is None:
+            return
+
+        rank = POLICIES.index(policy.name)
+        with self._lock:
+            record = self.records.get(path)
+            if record is not None and record[0] == sha1 and record[2:4] == signature:
+                rank = max(rank, record[1])  # a sampled pass does not undo a full one
+
+            self.records[path] = (sha1, rank, *signature, time.monotonic())
+
+    def clear(self):
+        with self._lock:
+            self.records.clear()
+
+    def take_hits(self):
+        with self._lock:
+            hits, self.hits = self.hits, 0
+            return hits
+
+
+def _signature(path: Path):
+    try:
+        stat = os.stat(str(path))
+    except OSError:
+        return None
+
+    return stat.st_size, stat.st_mtime_ns
+
+
+class StreamWriter:
+    # stands in for stdout/stderr during a request: each write becomes one message
+    def __init__(self, conn, name, lock, tty):
+        self.conn = conn
+        self.name = name
+        self.lock = lock
+        self.tty = tty
+
+    def write(self, text):
+        if text:
+            _send(self.conn, {self.name: text}, self.lock)
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return self.tty
+
+
+def _send(conn, message, lock=None):
+    data = (json.dumps(message) + "\n").encode('utf-8')
+    if lock is None:
+        conn.sendall(data)
+    else:
+        with lock:
+            conn.sendall(data)
+
+
+class LauncherDaemon:
+    # one folder (options.txt, Instance, Runtime) per daemon; launches are served one
+    # at a time, in process, with stdout and stderr streamed to the client
+    def __init__(self, base: Path, host="127.0.0.1", port=0):
+        self.base = base
+        self.token = secrets.token_hex(16)
+        self.tracker = DirtyTracker(self._roots())
+        self.launches = 0
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.bind((host, port))
+        self._sock.listen(4)
+        self.address = self._sock.getsockname()
+        self._lock = threading.Lock()
+
+    def _roots(self):
+        roots = [self.base / "Instance", self.base / "Runtime"]
+        appdata = os.environ.get("APPDATA")
+        if appdata:
+            roots.append(Path(appdata) / ".minecraft")
+
+        return roots
+
+    def run(self):
+        from nupdate.main import set_log_file
+        from nupdate.verify import set_trust
+
+        # clients keep launcher.log; the daemon's copy of every launch goes here
+        set_log_file((self.base / "daemon.log").open('a'))
+        set_trust(self.tracker)
+        self.tracker.start()
+
+        state = self.base / STATE_FILE
+        tpath = state.with_name(state.name + ".part")
+        tpath.write_text(json.dumps({"port": self.address[1], "token": self.token, "pid": os.getpid()}))
+        os.replace(str(tpath), str(state))
+        print(f"I: launcher daemon listening on {self.address[0]}:{self.address[1]}", flush=True)
+
+        try:
+            while True:
+                conn, _ = self._sock.accept()
+                threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+        except KeyboardInterrupt:
+            return 0
+        finally:
+            with contextlib.suppress(OSError):
+                if json.loads(state.read_text()).get("pid") == os.getpid():
+                    state.unlink()
+            self._sock.close()
+
+    def _serve(self, conn: socket.socket):
+        with conn, contextlib.suppress(OSError):  # the client went away
+            try:
+                request = json.loads(conn.makefile('rb').readline().decode('utf-8'))
+            except (OSError, ValueError):
+                return
+
+            if not secrets.compare_digest(str(request.get("token")), self.token):
+                _send(conn, {"error": "bad token"})
+                return
+
+            if request.get("command") != "launch":
+                _send(conn, {"error": f"unknown command {request.get('command')!r}"})
+                return
+
+            _send(conn, {"accepted": True})  # before the lock: a queued launch has answered too
+            with self._lock:
+                _send(conn, self._launch(conn, bool(request.get("tty"))))
+
+    def _launch(self, conn, tty):
+        # launches are serialized by self._lock, so one client owns the console at a time;
+        # only log() and the progress write to it, sys.stdout stays the daemon's own
+        from nupdate.main import finish_trace, log, prepare, set_console
+        from nupdate.progress import TransferProgress, finish_progress, set_progress
+        from nupdate.telemetry import build_report
+        from nupdate.trace import get_tracer
+        from nupdate.utils import clear_session
+
+        lock = threading.Lock()
+        out, err = StreamWriter(conn, "out", lock, tty), StreamWriter(conn, "err", lock, tty)
+        started = time.monotonic()
+        self.tracker.take_hits()
+        set_console(out, err)
+        set_progress(TransferProgress(out))
+        try:
+            try:
+                plan = prepare()
+            finally:
+                finish_progress()
+                clear_session()
+
+            telemetry = plan.telemetry
+            if telemetry is not None:
+                # from this launch's spans, which stay here; the client adds its spawn
+                telemetry = {"url": telemetry["url"], "report": build_report(get_tracer(), **telemetry["fields"])}
+
+            finish_trace()  # the client's spawn has no spans of ours
+            self.launches += 1
+            log(f"I: prepared by the launcher daemon in {time.monotonic() - started:.2f}s "
+                f"(launch {self.launches}, {self.tracker.take_hits()} files trusted unchanged, "
+                f"{len(self.tracker.records)} known)")
+        except SystemExit as e:
+            return {"exit": e.code if isinstance(e.code, int) else int(e.code is not None)}
+        except Exception:
+            return {"error": traceback.format_exc()}
+        finally:
+            set_console()
+
+        return {"plan": {
+            "args": [str(arg) for arg in plan.args],
+            "cwd": str(plan.cwd),
+            "keep_launcher": plan.keep_launcher,
+            "failed_marker": str(plan.failed_marker),
+            "telemetry": telemetry,
+        }}
+
+
+def request_launch(base: Path):
+    # => LaunchPlan from the daemon for base; None when there is none to ask
+    from nupdate.main import LaunchPlan, rawlog
+
+    try:
+        state = json.loads((base / STATE_FILE).read_text())
+        conn = socket.create_connection(("127.0.0.1", state["port"]), timeout=CONNECT_TIMEOUT)
+    except (OSError, ValueError, KeyError):
+        return None
+
+    with conn:
+        # the port of a stale state file may belong to another program by now; whatever
+        # listens there has until its first reply to show it is our daemon
+        reader = conn.makefile('rb')
+        try:
+            _send(conn, {"token": state.get("token"), "command": "launch", "tty": sys.stdout.isatty()})
+            reply = json.loads(reader.readline().decode('utf-8'))
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(reply, dict) or reply.get("error") == "bad token":
+            return None  # not ours, or a daemon started since the state file was written
+        if "error" in reply:
+            raise Exception(f"launcher daemon failed:\n{reply['error']}")
+        if not reply.get("accepted"):
+            return None
+
+        conn.settimeout(None)  # updates take as long as they take
+        for line in reader:
+            message = json.loads(line.decode('utf-8'))
+            if "out" in message:
+                sys.stdout.write(message["out"])
+                sys.stdout.flush()
+                rawlog(message["out"], end="")
+            elif "err" in message:
+                sys.stderr.write(message["err"])
+                rawlog(message["err"], end="")
+            elif "exit" in message:
+                sys.exit(message["exit"])
+            elif "error" in message:
+                raise Exception(f"launcher daemon failed:\n{message['error']}")
+            elif "plan" in message:
+                plan = message["plan"]
+                return LaunchPlan(plan["args"], Path(plan["cwd"]), plan["keep_launcher"],
+                                  Path(plan["failed_marker"]), None, plan.get("telemetry"))
+
+    raise Exception("launcher daemon closed the connection")
+
+
+def daemon_main(argv=None):
+    parser = argparse.ArgumentParser(prog="daemon")
+    parser.add_argument("--port", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    return LauncherDaemon(Path.cwd(), port=args.port).run()
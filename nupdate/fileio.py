@@ -0,0 +1,120 @@
+import errno
+import mmap
+import os
+import shutil
+import threading
+from pathlib import Path
+
+from nupdate.hashes import new_hash
+
+BUFFER_SIZE = 1 << 20
+MMAP_THRESHOLD = 64 << 20
+STREAM_CHUNK_MIN = 64 << 10
+STREAM_CHUNK_MAX = 1 << 20
+
+_local = threading.local()
+
+
+def get_buffer() -> memoryview:
+    # one reusable buffer per thread; parallel verification hashes from many threads
+    view = getattr(_local, 'view', None)
+    if view is None:
+        view = _local.view = memoryview(bytearray(BUFFER_SIZE))
+
+    return view
+
+
+def digest_file(path: Path, hobjs):
+    with open(str(path), 'rb', buffering=0) as fp:
+        size = os.fstat(fp.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for hobj in hobjs:
+                    hobj.update(mm)
+
+            return size
+
+        view = get_buffer()
+        while True:
+            length = fp.readinto(view)
+            if not length:
+                break
+
+            chunk = view[:length]
+            for hobj in hobjs:
+                hobj.update(chunk)
+
+    return size
+
+
+def hash_file(path: Path, name='sha1') -> str:
+    hobj = new_hash(name)
+    digest_file(path, (hobj,))
+    return hobj.hexdigest().lower()
+
+
+def hash_file_multi(path: Path, names) -> dict:
+    hobjs = {name: new_hash(name) for name in names}
+    digest_file(path, hobjs.values())
+    return {name: hobj.hexdigest().lower() for name, hobj in hobjs.items()}
+
+
+def stream_chunk_size(length=None):
+    if not length:
+        return STREAM_CHUNK_MIN
+
+    return min(max(length // 16, STREAM_CHUNK_MIN), STREAM_CHUNK_MAX)
+
+
+def _copy_range(src, dst, size):
+    fsrc, fdst = src.fileno(), dst.fileno()
+    copied = 0
+    copy_file_range = getattr(os, 'copy_file_range', None)
+    if copy_file_range is not None:
+        try:
+            while copied < size:
+                sent = copy_file_range(fsrc, fdst, size - copied)
+                if not sent:
+                    break
+                copied += sent
+        except OSError as e:
+            if copied or e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+        else:
+            return copied
+
+    sendfile = getattr(os, 'sendfile', None)
+    if sendfile is not None and os.name == 'posix':
+        try:
+            while copied < size:
+                sent = sendfile(fdst, fsrc, copied, size - copied)
+                if not sent:
+                    break
+                copied += sent
+        except OSError as e:
+            if copied or e.errno not in (errno.ENOSYS, errno.EINVAL, errno.ENOTSOCK):
+                raise
+        else:
+            return copied
+
+    view = get_buffer()
+    while True:
+        length = src.readinto(view)
+        if not length:
+            break
+
+        chunk = view[:length]
+        while chunk:
+            chunk = chunk[dst.write(chunk):]
+        copied += length
+
+    return copied
+
+
+def copy_file(src: Path, dst: Path) -> Path:
+    with open(str(src), 'rb', buffering=0) as fsrc, open(str(dst), 'wb', buffering=0) as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        _copy_range(fsrc, fdst, size)
+
+    shutil.copymode(str(src), str(dst))
+    return dst
@@ -0,0 +1,79 @@
+import hashlib
+import time
+from functools import lru_cache
+
+
+def _blake3():
+    import blake3
+    return blake3.blake3()
+
+
+# manifest key => hash object factory; sha1 is the baseline every manifest carries
+HASH_ALGORITHMS = {
+    'sha1': hashlib.sha1,
+    'sha256': hashlib.sha256,
+    'blake2b': hashlib.blake2b,
+    'blake3': _blake3,
+}
+
+# the ones a file may be accepted on, weakest first
+INTEGRITY_HASHES = ('sha1', 'sha256', 'blake2b', 'blake3')
+
+CALIBRATE_SIZE = 1 << 20
+
+
+def new_hash(name):
+    try:
+        factory = HASH_ALGORITHMS[name]
+    except KeyError:
+        raise ValueError(f"unknown hash {name!r}") from None
+
+    return factory()
+
+
+@lru_cache(maxsize=None)
+def hash_available(name):
+    try:
+        new_hash(name)
+    except (ImportError, ValueError):
+        return False
+
+    return True
+
+
+@lru_cache(maxsize=None)
+def hash_cost(name):
+    # seconds per CALIBRATE_SIZE bytes on this machine; CPUs with SHA extensions
+    # make sha1/sha256 cheaper than blake2b, so the order can't be hard coded.
+    data = bytes(CALIBRATE_SIZE)
+    best = None
+    for _ in range(3):
+        hobj = new_hash(name)
+        start = time.perf_counter()
+        hobj.update(data)
+        hobj.digest()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def negotiate(names):
+    # the cheapest listed hash this client can compute that is fit to verify with
+    candidates = [name for name in names if name in INTEGRITY_HASHES and hash_available(name)]
+    if not candidates:
+        return None
+
+    if len(candidates) == 1:
+        return candidates[0]
+
+    return min(candidates, key=hash_cost)
+
+
+def strongest(names):
+    # for bytes from a source that may be hostile (lan peers): cost doesn't matter
+    for name in reversed(INTEGRITY_HASHES):
+        if name in names and hash_available(name):
+            return name
+
+    return None
@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+FETCHED = "fetched"
+VERIFIED = "verified"
+DELETED = "deleted"
+
+
+class UpdateJournal:
+    # append-only json lines; the first line names the manifest the update is for,
+    # so a journal left by an interrupted update of another version is discarded.
+    FSYNC_INTERVAL = 1.0
+
+    def __init__(self, path: Path, key: str):
+        self.path = path
+        self.key = key
+        self.records = {}
+        self._fp = None
+        self._lock = threading.Lock()
+        self._next_sync = 0.0
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open(self):
+        self.records = self._replay()
+        if self.records is None:
+            self.records = {}
+            self._fp = self.path.open('w', encoding='utf-8')
+            self._write({"journal": 1, "key": self.key})
+        else:
+            self._fp = self.path.open('a', encoding='utf-8')
+
+        return self
+
+    def _replay(self):
+        try:
+            fp = self.path.open('r', encoding='utf-8')
+        except FileNotFoundError:
+            return None
+
+        records = {}
+        with fp:
+            try:
+                header = json.loads(fp.readline())
+            except ValueError:
+                return None
+
+            if header.get("key") != self.key:
+                return None
+
+            for line in fp:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # torn write at the crash point
+
+                if record["op"] == DELETED:
+                    records.pop(record["path"], None)
+                else:
+                    records[record["path"]] = record
+
+        return records
+
+    def _write(self, record):
+        self._fp.write(json.dumps(record, sort_keys=True) + "\n")
+        self._fp.flush()
+
+        now = time.monotonic()
+        if now >= self._next_sync:
+            os.fsync(self._fp.fileno())
+            self._next_sync = now + self.FSYNC_INTERVAL
+
+    def record(self, op, path: Path, key: str, full=False):
+        record = {"op": op, "path": key}
+        if op != DELETED:
+            stat = path.stat()
+            record.update(size=stat.st_size, mtime=stat.st_mtime_ns)
+        if full:
+            record["full"] = True
+
+        with self._lock:
+            if op == DELETED:
+                self.records.pop(key, None)
+            else:
+                self.records[key] = record
+
+            if self._fp is not None:
+                self._write(record)
+
+    def trusted(self, path: Path, key: str):
+        record = self.records.get(key)
+        if record is None:
+            return False
+
+        try:
+            stat = path.stat()
+        except OSError:
+            return False
+
+        return stat.st_size == record["size"] and stat.st_mtime_ns == record["mtime"]
+
+    def fully_checked(self, key: str):
+        # fetched (hash checked on arrival) or verified with a full policy or stronger
+        record = self.records.get(key)
+        return record is not None and (record["op"] == FETCHED or record.get("full", False))
+
+    def close(self):
+        with self._lock:
+            if self._fp is not None:
+                self._fp.flush()
+                os.fsync(self._fp.fileno())
+                self._fp.close()
+                self._fp = None
+
+    def remove(self):
+        self.close()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
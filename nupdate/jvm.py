@@ -0,0 +1,188 @@
+import os
+import re
+import subprocess
+from collections import namedtuple
+from functools import lru_cache
+from pathlib import Path
+
+JavaVersion = namedtuple("JavaVersion", "major version")
+
+VERSION_PATTERN = re.compile(r'version "([^"]+)"')
+
+
+def parse_java_version(version: str) -> JavaVersion:
+    # "1.8.0_51" => 8, "11.0.2" => 11, "17" => 17
+    parts = re.split(r"[._+-]", version)
+    major = int(parts[1]) if parts[0] == "1" and len(parts) > 1 else int(parts[0])
+    return JavaVersion(major, version)
+
+
+def java_home(java: Path) -> Path:
+    return Path(java).parent.parent  # <home>/bin/java(.exe)
+
+
+@lru_cache(maxsize=None)
+def java_version(java: Path) -> JavaVersion:
+    # <home>/release is cheap to read; spawning "java -version" costs a jvm start
+    release = java_home(java) / "release"
+    try:
+        for line in release.read_text(encoding='utf-8', errors='replace').splitlines():
+            key, _, value = line.partition("=")
+            if key.strip() == "JAVA_VERSION":
+                return parse_java_version(value.strip().strip('"'))
+    except (OSError, ValueError):
+        pass
+
+    executable = Path(java)
+    if executable.stem == "javaw":
+        executable = executable.with_name("java" + executable.suffix)
+
+    try:
+        proc = subprocess.run([str(executable), "-version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+
+    match = VERSION_PATTERN.search(proc.stderr.decode('utf-8', 'replace'))
+    if match is None:
+        return None
+
+    try:
+        return parse_java_version(match.group(1))
+    except ValueError:
+        return None
+
+
+LEGACY_VM_OPT = "-Xmx8G -XX:+UseConcMarkSweepGC -XX:+CMSIncrementalMode -XX:-UseAdaptiveSizePolicy -Xmn768M"
+AUTO = "auto"
+
+OS_RESERVE_MB = 3072  # left to the os, the launcher and the game's native memory
+MIN_HEAP_MB = 1024
+MAX_HEAP_MB = 16384  # past this g1 pauses grow faster than anything gains
+BASE_HEAP_MB = 1536
+HEAP_PER_MOD_MB = 8
+HEAP_PER_JAR_BYTE = 2  # loaded classes and assets outweigh the jars themselves
+HEAP_STEP_MB = 512
+
+GC_FLAGS = {
+    "g1": ["-XX:+UseG1GC", "-XX:MaxGCPauseMillis=50", "-XX:+ParallelRefProcEnabled", "-XX:+DisableExplicitGC",
+           "-XX:+UnlockExperimentalVMOptions", "-XX:G1NewSizePercent=20", "-XX:G1ReservePercent=20",
+           "-XX:G1HeapRegionSize=16M"],
+    "zgc": ["-XX:+UseZGC", "-XX:+DisableExplicitGC"],
+    "shenandoah": ["-XX:+UseShenandoahGC", "-XX:+DisableExplicitGC"],
+    "parallel": ["-XX:+UseParallelGC"],
+}
+
+JvmProfile = namedtuple("JvmProfile", "heap_mb gc options ram_mb cores java mods jar_bytes")
+
+
+def host_memory_mb():
+    try:
+        import ctypes
+
+        class MEMORYSTATUSEX(ctypes.Structure):
+            _fields_ = [
+                ("dwLength", ctypes.c_ulong),
+                ("dwMemoryLoad", ctypes.c_ulong),
+                ("ullTotalPhys", ctypes.c_ulonglong),
+                ("ullAvailPhys", ctypes.c_ulonglong),
+                ("ullTotalPageFile", ctypes.c_ulonglong),
+                ("ullAvailPageFile", ctypes.c_ulonglong),
+                ("ullTotalVirtual", ctypes.c_ulonglong),
+                ("ullAvailVirtual", ctypes.c_ulonglong),
+                ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+            ]
+
+        status = MEMORYSTATUSEX()
+        status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullTotalPhys >> 20
+    except (AttributeError, OSError):
+        pass
+
+    try:
+        return (os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')) >> 20
+    except (AttributeError, ValueError, OSError):
+        return 8192
+
+
+def parse_memory_mb(value):
+    # "6G", "6144M", "6144" (megabytes)
+    text = str(value).strip().upper()
+    if text.endswith("G"):
+        mb = int(float(text[:-1]) * 1024)
+    elif text.endswith("M"):
+        mb = int(text[:-1])
+    else:
+        mb = int(text)
+
+    if mb <= 0:
+        raise ValueError(f"not a heap size: {value!r}")
+
+    return mb
+
+
+def choose_gc(version: JavaVersion, heap_mb, cores):
+    major = version.major if version else 8
+    if major >= 21 and heap_mb >= 8192 and cores >= 8:
+        return "zgc"  # generational from 21 (the default from 23): short pauses without g1's tuning
+
+    return "g1"
+
+
+def choose_profile(version: JavaVersion, mods=0, jar_bytes=0, ram_mb=None, cores=None,
+                   max_memory=None, gc=None, log=print) -> JvmProfile:
+    ram_mb = ram_mb or host_memory_mb()
+    cores = cores or os.cpu_count() or 2
+
+    heap_mb = None
+    if max_memory:
+        try:
+            heap_mb = parse_memory_mb(max_memory)
+        except ValueError:
+            # a typo in options.txt ("6GB") must not stop the launch
+            log(f"W: max_memory {max_memory!r} is not a size like 6G or 6144M, sizing the heap automatically")
+
+    if heap_mb is None:
+        need = BASE_HEAP_MB + mods * HEAP_PER_MOD_MB + (jar_bytes * HEAP_PER_JAR_BYTE >> 20)
+        need = -(-need // HEAP_STEP_MB) * HEAP_STEP_MB
+        room = max(MIN_HEAP_MB, min(ram_mb - OS_RESERVE_MB, ram_mb * 3 // 4))
+        heap_mb = max(MIN_HEAP_MB, min(need, room, MAX_HEAP_MB))
+
+    if gc and gc.lower() not in GC_FLAGS:
+        log(f"W: unknown gc {gc!r} (expected one of {', '.join(GC_FLAGS)}), choosing automatically")
+        gc = None
+
+    gc = (gc or choose_gc(version, heap_mb, cores)).lower()
+
+    flags = list(GC_FLAGS[gc])
+    if gc == "zgc" and version is not None and 21 <= version.major < 23:
+        flags.append("-XX:+ZGenerational")
+    if cores <= 4:
+        flags.append(f"-XX:ParallelGCThreads={cores}")
+        flags.append("-XX:ConcGCThreads=1")
+
+    options = [f"-Xms{heap_mb // 2}M", f"-Xmx{heap_mb}M", *flags]
+    return JvmProfile(heap_mb, gc, options, ram_mb, cores, version, mods, jar_bytes)
+
+
+# options.txt "vm_opt": "auto" (the default) picks everything; other flags next to "auto"
+# are kept; without "auto" the string is used as is. "max_memory" and "gc" pin those choices.
+def vm_options(vm_opt, java: Path, mods=0, jar_bytes=0, max_memory=None, gc=None, log=print):
+    if not vm_opt or vm_opt == LEGACY_VM_OPT:
+        vm_opt = AUTO  # the old default was written into options.txt; runtimes past 8 reject CMS
+
+    tokens = vm_opt.split()
+    if AUTO not in tokens:
+        return tokens, None
+
+    profile = choose_profile(java_version(java), mods, jar_bytes, max_memory=max_memory, gc=gc, log=log)
+    extra = [token for token in tokens if token != AUTO]
+    return profile.options + extra, profile
+
+
+def describe(profile: JvmProfile):
+    java = profile.java.version if profile.java else "?"
+    return (f"heap {profile.heap_mb}M, {profile.gc} "
+            f"(ram {profile.ram_mb}M, {profile.cores} cores, java {java}, "
+            f"{profile.mods} mods, {profile.jar_bytes >> 20}M of jars)")
@@ -1,32 +1,53 @@
-import encodings
+import codecs
 import json
+import locale
 import os
-import pkgutil
 import platform
 import shutil
 import subprocess
 import sys
+import time
 import traceback
-import webbrowser
+from collections import Counter, namedtuple
 from functools import lru_cache
 from json import JSONDecodeError
 from pathlib import Path
 
-import mojang_api
-import requests
-
 from nupdate import LAUNCHER_VERSION
+from nupdate.fileio import copy_file
+from nupdate.bundle import fetch_bundled
+from nupdate.journal import DELETED, UpdateJournal
+from nupdate.jvm import AUTO, LEGACY_VM_OPT, describe, vm_options
+from nupdate.manifest import diff_files, parent_dirs, stat_signatures
+from nupdate.mirrors import configure_mirrors
 from nupdate.mojang.java import MojangJava
 from nupdate.mojang.minecraft import MojangMinecraftPackage
-from nupdate.utils import Namespace, NSFileFetchable, calc_sha1_hash, clear_session
+from nupdate.progress import finish_progress
+from nupdate.trace import disable as disable_trace, enable as enable_trace, get_tracer, span
+from nupdate.utils import Namespace, NSFileFetchable, calc_sha1_hash, clear_session, fetch_bytes
+from nupdate.verify import (DEFAULT_SAMPLE, FULL, VerifyPolicy, configure_policies, download_entries, get_trust,
+                            verify_entries)
+
+# codecs used by json/http (utf-8, idna, latin-1) and by the console/locale on
+# korean windows; the frozen build only ships these.
+REQUIRED_CODECS = ("utf_8", "ascii", "latin_1", "idna", "cp949", "mbcs")
+
+
+def import_codecs():
+    for name in (*REQUIRED_CODECS, locale.getpreferredencoding(False)):
+        try:
+            codecs.lookup(name)
+        except LookupError:
+            pass
+
 
 if not getattr(sys, "frozen", False):
-    for module in pkgutil.iter_modules(encodings.__path__, encodings.__name__ + "."):
-        if not module.ispkg:
-            __import__(module.name)
+    import_codecs()
 
 
 class ModpackSingleDownload(NSFileFetchable):
+    section = None  # always fully verified
+
     def __init__(self, data, path: Path):
         super().__init__(data)
         self._basepath = path
@@ -46,6 +67,8 @@ class ModpackSingleDownload(NSFileFetchable):
 
 
 class Modpack(Namespace):
+    TREE_STATE = 'modpack.tree.json'
+
     def __init__(self, file: ModpackSingleDownload, path: Path, is_fresh):
         data = file.json()
         super().__init__(data)
@@ -63,11 +86,21 @@ class Modpack(Namespace):
             self.path.mkdir(parents=True, exist_ok=True)
 
         donefile = self.path / 'modpack.done'
-        if self.is_fresh or not donefile.exists():
-            if donefile.exists():
+        interrupted = not donefile.exists()
+        if self.is_fresh or interrupted:
+            if not interrupted:
                 donefile.unlink()
-            self._download_files()
+
+            # an interrupted update of the same manifest resumes from its journal
+            journal = UpdateJournal(self.path / 'modpack.journal', calc_sha1_hash(self.file.local_path))
+            with journal:
+                self._download_files(journal, interrupted)
+
+            self._write_installed()
             donefile.touch()
+            journal.remove()
+        else:
+            self._verify_files()
 
         keepmods = self.path / 'keepmods'
         if not keepmods.is_dir():
@@ -81,18 +114,19 @@ class Modpack(Namespace):
             if src.stat().st_size == 0:
                 if dst.exists():
                     dst.unlink()
-            elif not dst.exists() or calc_sha1_hash(src) != calc_sha1_hash(dst):
+            elif (not dst.exists() or src.stat().st_size != dst.stat().st_size
+                  or calc_sha1_hash(src) != calc_sha1_hash(dst)):
                 if not dst.parent.exists():
                     dst.parent.mkdir(exist_ok=True, parents=True)
 
-                shutil.copy(str(src), str(dst))
+                copy_file(src, dst)
 
         if has_keepmods:
             result_set.add("has_keepmods")
 
         return result_set
 
-    def _download_files(self):
+    def _download_files(self, journal: UpdateJournal = None, interrupted=False):
         files = self.files
 
         @lru_cache()
@@ -107,6 +141,28 @@ class Modpack(Namespace):
 
             return False
 
+        # an interrupted update left files of a version installed.json doesn't know,
+        # so a diff against it can't tell what to remove
+        installed = self.installed
+        if installed is None or interrupted:
+            self._sweep_files(files, ignore_folder, journal)
+            self._repair(self.entries(), set(files), journal)
+            return
+
+        # only act on what changed since the installed manifest
+        diff = diff_files(installed.get('files', ()), self['files'])
+        for spath in diff.removed:
+            path = self.path / spath
+            if spath.endswith('.__ignore__') or ignore_folder(spath) or not path.is_file():
+                continue
+
+            path.unlink()
+            if journal is not None:
+                journal.record(DELETED, path, spath)
+
+        self._repair(self.entries(), set(diff.added) | set(diff.changed), journal)
+
+    def _sweep_files(self, files, ignore_folder, journal: UpdateJournal = None):
         for name in "mods", "config", "scripts":
             folder = self.path / name
             for path in folder.glob("**/*"):  # type: Path
@@ -118,14 +174,107 @@ class Modpack(Namespace):
                 if path.is_file():
                     if spath not in files:
                         path.unlink()
+                        if journal is not None:
+                            journal.record(DELETED, path, spath)
                 elif path.is_dir() and spath in files:
                     path.rmdir()
 
-        for key, file in files.items():
+    def _verify_files(self):
+        self._repair(self.entries(skip_keepmods=True))
+
+    def _repair(self, entries, full_paths=(), journal: UpdateJournal = None):
+        tree = self.get('tree') or {}
+        trusted = self._trusted_subtrees(tree)
+        all_entries = list(entries)
+        entries = [
+            entry for entry in all_entries
+            if not any(dirname in trusted for dirname in parent_dirs(entry[0].path))
+        ]
+
+        verified = []
+        repairs = verify_entries([entry for entry in entries if entry[0].path in full_paths],
+                                 minimum=FULL, journal=journal, verified=verified)
+        repairs += verify_entries([entry for entry in entries if entry[0].path not in full_paths],
+                                  journal=journal, verified=verified)
+
+        left = fetch_bundled(self.get('bundles') or [], repairs, journal)
+        if not download_entries(left, journal=journal):
+            raise Exception("repair failed")
+
+        # fetched files passed a full check too
+        verified.extend(repairs)
+        if tree:
+            self._record_subtrees(tree, trusted, verified, all_entries)
+
+    def _trusted_subtrees(self, tree):
+        # subtrees whose manifest hash is the one last fully verified here and
+        # whose files kept their names, sizes and mtimes since
+        state = self.tree_state
+        candidates = {dirname for dirname, value in tree.items() if state.get(dirname, {}).get('hash') == value}
+        if not candidates:
+            return set()
+
+        signatures = stat_signatures(self.path, {dirname.partition('/')[0] for dirname in candidates})
+        return {dirname for dirname in candidates if state[dirname].get('signature') == signatures.get(dirname)}
+
+    def _record_subtrees(self, tree, trusted, verified, entries):
+        # entries: the set the verify pass worked on (keepmods skipped when it skipped them)
+        good = {fetchable.path for fetchable, _ in verified}
+        totals, goods = Counter(), Counter()
+        for fetchable, _ in entries:
+            dirnames = parent_dirs(fetchable.path)
+            ok = fetchable.path in good or any(dirname in trusted for dirname in dirnames)
+            for dirname in dirnames:
+                totals[dirname] += 1
+                goods[dirname] += ok
+
+        complete = [dirname for dirname in tree if totals[dirname] and totals[dirname] == goods[dirname]]
+        signatures = stat_signatures(self.path, {dirname.partition('/')[0] for dirname in complete})
+        state = {
+            dirname: {'hash': tree[dirname], 'signature': signatures[dirname]}
+            for dirname in complete if dirname in signatures
+        }
+
+        path = self.path / self.TREE_STATE
+        tpath = path.with_name(path.name + '.part')
+        tpath.write_text(json.dumps(state, indent=2))
+        os.replace(str(tpath), str(path))
+
+    @property
+    def tree_state(self):
+        try:
+            return json.loads((self.path / self.TREE_STATE).read_text())
+        except (FileNotFoundError, JSONDecodeError):
+            return {}
+
+    def entries(self, skip_keepmods=False):
+        keepmods = self.path / 'keepmods'
+        entries = []
+        for key, file in self.files.items():
             if key.endswith('.__ignore__'):
                 continue
 
-            file.download(self.path)
+            # replaced by keepmods after the update, so it never matches the manifest
+            if skip_keepmods and key.startswith('mods/') and (keepmods / key[len('mods/'):]).exists():
+                continue
+
+            entries.append((file, self.path))
+
+        return entries
+
+    @property
+    def installed(self):
+        # the manifest of the last completed update
+        try:
+            return json.loads((self.path / 'modpack.installed.json').read_text(encoding="utf-8"))
+        except (FileNotFoundError, JSONDecodeError):
+            return None
+
+    def _write_installed(self):
+        path = self.path / 'modpack.installed.json'
+        tpath = path.with_name(path.name + '.part')
+        copy_file(self.file.local_path, tpath)
+        os.replace(str(tpath), str(path))
 
     @property
     def files(self):
@@ -139,8 +288,8 @@ class Modpacks(Namespace):
         super().__init__(self._fetch())
 
     def _fetch(self):
-        with requests.session() as session:
-            return session.get(self.url).json()
+        _, content = fetch_bytes(self.url)
+        return json.loads(content.decode('utf-8'))
 
     def raw_package(self, name):
         package = self['packages'][name]
@@ -157,16 +306,47 @@ class Modpacks(Namespace):
         return Modpack(file, self.path / name, is_fresh)
 
 
-log_file = (Path.cwd() / "launcher.log").open('w')
+_log_file = None
+
+
+def get_log_file():
+    global _log_file
+    if _log_file is None:
+        _log_file = (Path.cwd() / "launcher.log").open('w')
+
+    return _log_file
+
+
+def set_log_file(fp):
+    global _log_file
+    _log_file = fp
 
 
 def rawlog(*args, sep=" ", end="\n"):
+    log_file = get_log_file()
     print(*args, sep=sep, end=end, file=log_file)
     log_file.flush()
 
 
-def log(*args, sep=" ", end="\n", file=sys.stdout):
-    print(*args, sep=sep, end=end, file=file)
+# (out, err) of the client a resident launcher is preparing a launch for; threads of
+# the daemon itself (watchers, peers) keep printing to its own stdout
+_console = None
+
+
+def set_console(out=None, err=None):
+    global _console
+    _console = (out, err or out) if out is not None else None
+
+
+def console(err=False):
+    if _console is not None:
+        return _console[1 if err else 0]
+
+    return sys.stderr if err else sys.stdout
+
+
+def log(*args, sep=" ", end="\n", file=None):
+    print(*args, sep=sep, end=end, file=file or console())
     rawlog(*args, sep=sep, end=end)
 
 
@@ -174,30 +354,60 @@ def prettyjson(obj):
     return json.dumps(obj, indent=4, default=Namespace._json_dumper)
 
 
+STILL_RUNNING = "running"  # launch.failed content when the launcher quit before the game
+CLEAN_EXIT_MARKER = b"Stopping!"  # minecraft's last line on a normal quit
+CLEAN_EXIT_TAIL = 64 << 10
+
+# what prepare() leaves for spawn(); a resident launcher sends it over its socket
+LaunchPlan = namedtuple("LaunchPlan", "args cwd keep_launcher failed_marker prewarm telemetry")
+
+
 def launch():
+    from nupdate.daemon import request_launch
+
+    # with a resident launcher running for this folder it prepares; this process only spawns
+    plan = request_launch(Path.cwd())
+    if plan is None:
+        plan = prepare()
+
+    sys.exit(spawn(plan))
+
+
+def prepare() -> LaunchPlan:
     log(f"I: SM-REBoot Launcher v{LAUNCHER_VERSION}")
 
     BASE = Path.cwd()
 
     options_file = BASE / 'options.txt'
     if not options_file.exists():
-        log("E: options missing error", file=sys.stderr)
+        log("E: options missing error", file=console(err=True))
         sys.exit(1)
 
     options = json.loads(options_file.read_text())  # type: dict
 
+    # telemetry reads its numbers off the spans, so it traces too (without writing a file)
+    trace = options.get('trace')
+    send_telemetry = options.get('telemetry', False)
+    if trace or send_telemetry:
+        enable_trace(trace.get('profile') if isinstance(trace, dict) else None,
+                     BASE / 'launcher.trace.json' if trace else None)
+
     try:
         options.setdefault("version", "0.1")
         options.setdefault("java_reversion", "0.1")
         package_index_url = options['url']  # 'file:///D:/Launcher/Remote/index.json'
         package_name = options['package']  # hello
     except KeyError as e:
-        log(f"E: setting {e.args[0]!r} missing", file=sys.stderr)
+        log(f"E: setting {e.args[0]!r} missing", file=console(err=True))
         sys.exit(1)
     else:
-        vm_opt_str = options.setdefault('vm_opt',
-                                        "-Xmx8G -XX:+UseConcMarkSweepGC -XX:+CMSIncrementalMode -XX:-UseAdaptiveSizePolicy -Xmn768M")
+        vm_opt_str = options.setdefault('vm_opt', AUTO)
+        if vm_opt_str == LEGACY_VM_OPT:
+            vm_opt_str = options['vm_opt'] = AUTO
+        max_memory = options.get('max_memory')
+        gc = options.get('gc')
         keep_launcher = options.setdefault('keep_launcher', True)
+        use_cds = options.get('cds', False)
 
     try:
         java = MojangJava(BASE / "Runtime")
@@ -218,12 +428,20 @@ def launch():
     finally:
         log()
 
-        mps = Modpacks(package_index_url, BASE / 'Instance')
+        # the user's mirrors can serve index.json itself; the index names more for the files
+        configure_mirrors(options.get("mirrors"))
+        with span("index"):
+            mps = Modpacks(package_index_url, BASE / 'Instance')
+        mirrors = configure_mirrors(mps.get("mirrors"))
 
         log("I: server's general infomation")
         log(prettyjson(mps))
         log()
 
+        for origin, bases in mirrors.items():
+            if len(bases) > 1:
+                log("I: mirrors for", origin, "=", ", ".join(bases[1:]))
+
         launcher = mps.get("launcher", {})
         if not launcher:
             log("W: there is no launcher infomation")
@@ -232,6 +450,8 @@ def launch():
                 log("I: You need update to new launcher!")
                 url = launcher.get("url")
                 if url:
+                    import webbrowser
+
                     log("I: launcher url =", url)
                     webbrowser.open(url)
                 sys.exit(1)
@@ -260,24 +480,56 @@ def launch():
 
     mp = mps.package(package_name)
 
+    # removed again once minecraft exits cleanly; a leftover marker means the last
+    # launch failed or was killed, so this one verifies everything
+    failed_marker = mp.path / 'launch.failed'
+    escalate = previous_launch_failed(failed_marker, mp.path)
+    policies = configure_policies(options, mp.get('verify'), escalate)
+    if escalate:
+        log("W: previous launch failed, verify everything")
+        if get_trust() is not None:
+            get_trust().clear()
+        tree_state = mp.path / Modpack.TREE_STATE
+        if tree_state.exists():
+            tree_state.unlink()
+    log("I: verify policy =", ", ".join(f"{section}:{policy.name}" for section, policy in policies.items()))
+
+    if options.get("peers"):
+        from nupdate.peer import configure_peers
+
+        log("I: lan peers =", ", ".join(configure_peers(options)) or "none found")
+
+    failed_marker.parent.mkdir(parents=True, exist_ok=True)
+    failed_marker.write_text('')  # not touch(): a "running" left from last time must go
+
     log("I: enter package update")
     try:
-        mp_result = mp()
+        with span("package"):
+            mp_result = mp()
         if "has_keepmods" in mp_result:
             log("I: package has keepmods!")
     except:
-        log("E: failure package update", file=sys.stderr)
+        log("E: failure package update", file=console(err=True))
         raise
     else:
         log("I: finish package update")
 
+    prewarm = None
+    if options.get('prewarm', False):
+        from nupdate.prewarm import Prewarmer
+
+        # mods load right after the jvm starts; warm them while java and minecraft update
+        prewarm = Prewarmer(options.get('prewarm_budget'))
+        prewarm.add_tree(mp.path / 'mods')
+
     if java.runtime is None:
         log("I: enter java update")
 
     try:
-        runtime = java()  # type: Path
+        with span("java"):
+            runtime = java()  # type: Path
     except:
-        log("E: failure java update", file=sys.stderr)
+        log("E: failure java update", file=console(err=True))
         raise
     else:
         log("I: java updated")
@@ -288,14 +540,22 @@ def launch():
 
     log("I: enter minecraft update")
     try:
-        mc()
+        with span("minecraft"):
+            mc()
     except:
-        log("E: failure minecraft update", file=sys.stderr)
+        log("E: failure minecraft update", file=console(err=True))
         raise
     else:
+        finish_progress()
         log("I: finish minecraft update")
 
-    print("I: minecraft profile checking")
+    if options.get("peers"):
+        from nupdate.peer import start_peer_server
+
+        sharing = start_peer_server(mp.entries(skip_keepmods=True) + mc.entries(), options.get("peer_port"))
+        log("I: sharing files with lan peers on port", sharing.address[1])
+
+    log("I: minecraft profile checking")
 
     try:
         profile = mpkg.profile
@@ -305,38 +565,42 @@ def launch():
 
     clientToken = profile.clientToken
     if not clientToken:
-        log("E: minecraft profile currupt (missing clientToken)", file=sys.stderr)
+        log("E: minecraft profile currupt (missing clientToken)", file=console(err=True))
         sys.exit(1)
 
     selectedAccount = profile.selectedAccount
     if not selectedAccount:
-        log("E: minecraft profile currupt (missing selectedUser)", file=sys.stderr)
+        log("E: minecraft profile currupt (missing selectedUser)", file=console(err=True))
         sys.exit(1)
 
     auth_uuid = selectedAccount.auth_uuid
     if not auth_uuid:
-        log("E: minecraft profile currupt (missing selectedUser.profile)", file=sys.stderr)
+        log("E: minecraft profile currupt (missing selectedUser.profile)", file=console(err=True))
         sys.exit(1)
 
     auth_player_name = selectedAccount.auth_player_name
     if not auth_player_name:
-        log("E: minecraft profile currupt (missing displayName)", file=sys.stderr)
+        log("E: minecraft profile currupt (missing displayName)", file=console(err=True))
         sys.exit(1)
 
     auth_access_token = selectedAccount.auth_access_token
     if not auth_access_token:
-        log("E: minecraft profile currupt (missing accessToken)", file=sys.stderr)
+        log("E: minecraft profile currupt (missing accessToken)", file=console(err=True))
         sys.exit(1)
 
+    import mojang_api
+
     try:
-        api_result = mojang_api.validate_access_token(auth_access_token, client_token=clientToken)
+        with span("token"):
+            api_result = mojang_api.validate_access_token(auth_access_token, client_token=clientToken)
     except ValueError:
         # Actually this is successful response..?
         api_result = {}
 
     if api_result.get('error'):
         log("I: mojang token refreshing...")
-        api_result = mojang_api.refresh_access_token(auth_access_token, client_token=clientToken)
+        with span("token_refresh"):
+            api_result = mojang_api.refresh_access_token(auth_access_token, client_token=clientToken)
         if not api_result.get('error'):
             auth_access_token = api_result.accessToken
 
@@ -346,17 +610,17 @@ def launch():
             try:
                 mpkg.profile_write(profile)
             except:
-                log("E: mojang profile write failure", file=sys.stderr)
+                log("E: mojang profile write failure", file=console(err=True))
                 raise
             else:
                 log("I: mojang token successful refreshed")
         else:
-            log("E: mojang token refresh failed (please login with minecraft launcher)", file=sys.stderr)
+            log("E: mojang token refresh failed (please login with minecraft launcher)", file=console(err=True))
             log("E: error message from mojang:", api_result.get('errorMessage', 'errorMessage missing'),
-                file=sys.stderr)
+                file=console(err=True))
             sys.exit(1)
 
-    print("I: finish profile checking")
+    log("I: finish profile checking")
 
     options = {
         'version_name': mp['version'],
@@ -375,8 +639,8 @@ def launch():
         arguments = arguments.replace("${" + key + "}", str(value))
 
     if "$" in arguments:
-        log("E: untranslated argument ($ exists)", file=sys.stderr)
-        log(f"E: argument = {arguments!r}", file=sys.stderr)
+        log("E: untranslated argument ($ exists)", file=console(err=True))
+        log(f"E: argument = {arguments!r}", file=console(err=True))
 
     classpath = []
 
@@ -387,6 +651,8 @@ def launch():
                 classpath.append(path)
 
     classpath.append(mc.client.local_path)
+    if prewarm is not None:
+        prewarm.add(classpath)
 
     os_version_options = []
     if platform.system() == 'Windows' and platform.release() == '10':
@@ -395,6 +661,21 @@ def launch():
             "-Dos.version=10.0",
         ])
 
+    mods = [info for info in mp['files'] if info['path'].startswith('mods/') and info['path'].endswith('.jar')]
+    jar_bytes = sum(int(info.get('size') or 0) for info in mods)
+    vm_options_list, profile = vm_options(vm_opt_str, runtime, len(mods), jar_bytes, max_memory, gc, log=log)
+    if profile is not None:
+        log("I: jvm profile =", describe(profile))
+
+    cds_options = []
+    if use_cds:
+        from nupdate.cds import ClassDataArchive
+
+        archive = ClassDataArchive(mp.path / 'cds', runtime, classpath)
+        with span("cds"):
+            cds_options, cds_state = archive.prepare(last_launch_ok=not escalate)
+        log(f"I: class data sharing = {cds_state} (java {archive.version.version if archive.version else '?'})")
+
     if not keep_launcher:
         runtime = runtime.with_name("javaw.exe")
 
@@ -408,7 +689,8 @@ def launch():
         f'-Dminecraft.client.jar={mc.client.local_path}',
         "-cp",
         ";".join(map(str, classpath)),
-        *vm_opt_str.split(),
+        *vm_options_list,
+        *cds_options,
         f"{mc['mainClass']}",
         *arguments.split(),
     ]
@@ -431,23 +713,219 @@ def launch():
         else:
             log(arg)
     log()
+
+    if prewarm is not None:
+        log("I: prewarm =", prewarm.describe())
+
+    telemetry = None
+    if send_telemetry:
+        from nupdate.telemetry import telemetry_url
+
+        url = telemetry_url(mps.get('telemetry'))
+        if url:
+            # the report is built by spawn(), once the jvm start is traced too
+            telemetry = {"url": url, "fields": {"package": package_name, "version": mp['version'],
+                                                "escalated": escalate}}
+
+    return LaunchPlan(args, mp.path, keep_launcher, failed_marker, prewarm, telemetry)
+
+
+def previous_launch_failed(marker: Path, cwd: Path):
+    if not marker.exists():
+        return False
+
+    if marker.read_text() != STILL_RUNNING:
+        return True
+
+    # the launcher stopped waiting after a while; clean only if the game logged its
+    # shutdown after that and left no crash report behind
+    since = marker.stat().st_mtime
+    crashes = list((cwd / 'crash-reports').glob('*.txt')) + list(cwd.glob('hs_err_pid*.log'))
+    if any(path.stat().st_mtime > since for path in crashes):
+        return True
+
+    log_file = cwd / 'logs' / 'latest.log'
+    try:
+        if log_file.stat().st_mtime < since:
+            return True
+
+        with log_file.open('rb') as fp:
+            fp.seek(max(0, log_file.stat().st_size - CLEAN_EXIT_TAIL))
+            return CLEAN_EXIT_MARKER not in fp.read()
+    except OSError:
+        return True
+
+
+def spawn(plan: LaunchPlan):
     log("I: start minecraft")
 
-    proc = subprocess.Popen(
-        args,
-        cwd=f'{mp.path}'
-    )
+    spawned = time.time()
+    with span("spawn"):
+        proc = subprocess.Popen(
+            plan.args,
+            cwd=f'{plan.cwd}'
+        )
+    report = launch_report(plan.telemetry, time.time() - spawned)
+    finish_trace()
 
-    if keep_launcher:
-        sys.exit(proc.wait())
+    if plan.keep_launcher:
+        from nupdate.prewarm import watch_menu
+
+        # compare across launches with "prewarm" on and off
+        watch_menu(plan.cwd / 'logs' / 'latest.log', spawned, lambda elapsed: log(f"I: main menu after {elapsed:.1f}s"))
+
+        exitcode = proc.wait()
     else:
         try:
-            sys.exit(proc.wait(timeout=10))
+            exitcode = proc.wait(timeout=10)
         except subprocess.TimeoutExpired:
-            sys.exit(0)
+            # still running: the marker stays, the next launch reads how the game ended
+            exitcode = None
+            plan.failed_marker.write_text(STILL_RUNNING)
+
+    if plan.prewarm is not None:
+        plan.prewarm.stop()
+        log("I: prewarm =", plan.prewarm.describe())
+
+    if exitcode == 0 and plan.failed_marker.exists():
+        plan.failed_marker.unlink()
+
+    if report is not None:
+        from nupdate.telemetry import send_report
+
+        sent = send_report(plan.telemetry["url"], dict(report, exit=exitcode))
+        log("I: launch report sent" if sent else "W: launch report not sent")
+
+    return exitcode
+
+
+def launch_report(telemetry, spawn_seconds):
+    # a plan from the launcher daemon brings the report of its prepare(); the spawn here
+    # was traced by nobody, so its time is added by hand
+    if telemetry is None:
+        return None
+
+    from nupdate.telemetry import build_report
+
+    report = telemetry.get("report")
+    if report is None:
+        return build_report(get_tracer(), **telemetry["fields"])
+
+    return dict(report, phases=dict(report["phases"], spawn=round(spawn_seconds, 3)))
+
+
+def finish_trace():
+    # writes and summarizes the launch's spans when options.txt asked for a trace
+    tracer = disable_trace()
+    if tracer is None or tracer.output is None:
+        return
+
+    tracer.write(tracer.output)
+    log("I: trace written to", tracer.output)
+    log(tracer.summary())
+
+
+def installed_package(BASE: Path, package_name):
+    # the installed manifest as is; no index fetch
+    path = BASE / 'Instance' / package_name
+    mp = Modpack(ModpackSingleDownload({'path': 'modpack.json'}, path), path, is_fresh=False)
+
+    APPDATA = Path(os.environ.get("APPDATA"))
+    mpkg = MojangMinecraftPackage(APPDATA / ".minecraft")
+    return mp, mpkg.build(package_name, mp)
+
+
+def verify(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="verify")
+    parser.add_argument("--repair", action="store_true", help="download broken or missing files")
+    parser.add_argument("--policy", default="full", help="stat, sample, full or paranoid")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    BASE = Path.cwd()
+
+    options_file = BASE / 'options.txt'
+    if not options_file.exists():
+        log("E: options missing error", file=console(err=True))
+        sys.exit(1)
+
+    options = json.loads(options_file.read_text())  # type: dict
+    mp, mc = installed_package(BASE, options['package'])
+
+    entries = mp.entries(skip_keepmods=True) + mc.entries()
+    policy = VerifyPolicy(args.policy, options.get("verify_sample", DEFAULT_SAMPLE))
+
+    log(f"I: verify {len(entries)} files ({policy.name})")
+    repairs = verify_entries(entries, policy, workers=args.workers)
+    for fetchable, basepath in repairs:
+        log("W: broken", basepath / fetchable.path)
+
+    log(f"I: {len(repairs)} broken files")
+    if not repairs:
+        return 0
+
+    if not args.repair:
+        return 1
+
+    log("I: enter repair")
+    if not download_entries(repairs):
+        log("E: failure repair", file=console(err=True))
+        return 1
+
+    finish_progress()
+    mc.extract_natives()
+    log("I: finish repair")
+    return 0
+
+
+def peer(argv):
+    import argparse
+
+    from nupdate.peer import start_peer_server
+
+    parser = argparse.ArgumentParser(prog="peer")
+    parser.add_argument("--port", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    BASE = Path.cwd()
+
+    options_file = BASE / 'options.txt'
+    if not options_file.exists():
+        log("E: options missing error", file=console(err=True))
+        sys.exit(1)
+
+    options = json.loads(options_file.read_text())  # type: dict
+    mp, mc = installed_package(BASE, options['package'])
+
+    entries = mp.entries(skip_keepmods=True) + mc.entries()
+    server = start_peer_server(entries, args.port or options.get("peer_port"))
+    log(f"I: sharing {len(server.index.paths)} files with lan peers on port {server.address[1]}")
+    try:
+        while True:
+            time.sleep(60)
+            log(f"I: {server.requests} requests served")
+    except KeyboardInterrupt:
+        return 0
 
 
 def main():
+    if sys.argv[1:2] == ["verify"]:
+        try:
+            sys.exit(verify(sys.argv[2:]))
+        finally:
+            finish_progress()
+            clear_session()
+
+    if sys.argv[1:2] == ["peer"]:
+        sys.exit(peer(sys.argv[2:]))
+
+    if sys.argv[1:2] == ["daemon"]:
+        from nupdate.daemon import daemon_main
+
+        sys.exit(daemon_main(sys.argv[2:]))
+
     try:
         launch()
     except SystemExit as e:
@@ -458,9 +936,10 @@ def main():
         raise
     except Exception:
         traceback.print_exc()
-        traceback.print_exc(file=log_file)
+        traceback.print_exc(file=get_log_file())
         subprocess.Popen(["pause"], shell=True).wait()
     finally:
+        finish_progress()
         clear_session()
 
 
@@ -0,0 +1,99 @@
+import hashlib
+import os
+from collections import namedtuple
+from pathlib import Path
+
+from nupdate.hashes import HASH_ALGORITHMS
+
+ManifestDiff = namedtuple("ManifestDiff", "added changed removed unchanged")
+
+
+def same_file(old, new):
+    if old.get('size') != new.get('size'):
+        return False
+
+    common = [name for name in HASH_ALGORITHMS if old.get(name) and new.get(name)]
+    if not common:
+        return False
+
+    return all(old[name].lower() == new[name].lower() for name in common)
+
+
+# old/new are the "files" lists of two modpack.json; results hold paths
+def diff_files(old, new) -> ManifestDiff:
+    old = {info['path']: info for info in old}
+    new = {info['path']: info for info in new}
+
+    added, changed, unchanged = [], [], []
+    for path, info in new.items():
+        previous = old.get(path)
+        if previous is None:
+            added.append(path)
+        elif same_file(previous, info):
+            unchanged.append(path)
+        else:
+            changed.append(path)
+
+    removed = [path for path in old if path not in new]
+    return ManifestDiff(added, changed, removed, unchanged)
+
+
+def parent_dirs(path: str):
+    parts = path.split('/')[:-1]
+    return ['/'.join(parts[:index]) for index in range(1, len(parts) + 1)]
+
+
+# directory path => hash over its children, like a git tree; the root is not included
+def build_tree(files):
+    children = {}
+    for info in files:
+        path = info['path']
+        dirname, _, name = path.rpartition('/')
+        children.setdefault(dirname, []).append(('f', name, f"{info.get('sha1')} {info.get('size')}"))
+        for parent in parent_dirs(path):
+            children.setdefault(parent, [])
+
+    tree = {}
+    for dirname in sorted(children, key=lambda item: item.count('/'), reverse=True):
+        if not dirname:
+            continue
+
+        hobj = hashlib.sha1()
+        for kind, name, value in sorted(children[dirname]):
+            hobj.update(f"{kind} {name} {value}\n".encode('utf-8'))
+
+        tree[dirname] = hobj.hexdigest()
+        parent, _, name = dirname.rpartition('/')
+        children.setdefault(parent, []).append(('d', name, tree[dirname]))
+
+    return dict(sorted(tree.items()))
+
+
+# same shape as build_tree, but over local (name, size, mtime); cheap to compute with scandir
+def stat_signatures(base: Path, roots):
+    signatures = {}
+
+    def walk(rpath):
+        try:
+            it = os.scandir(str(base / rpath))
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+        hobj = hashlib.sha1()
+        with it:
+            for entry in sorted(it, key=lambda item: item.name):
+                if entry.is_dir(follow_symlinks=False):
+                    line = f"d {entry.name} {walk(rpath + '/' + entry.name)}\n"
+                else:
+                    stat = entry.stat(follow_symlinks=False)
+                    line = f"f {entry.name} {stat.st_size} {stat.st_mtime_ns}\n"
+
+                hobj.update(line.encode('utf-8', 'surrogateescape'))
+
+        signatures[rpath] = hobj.hexdigest()
+        return signatures[rpath]
+
+    for root in roots:
+        walk(root)
+
+    return signatures
@@ -0,0 +1,256 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+FETCH_ATTEMPTS = 3  # per url, plus one per extra mirror
+
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+
+BREAKER_FAILURES = 3  # consecutive failures that open a mirror's circuit
+BREAKER_COOLDOWN = 15.0  # doubled every time it opens again, up to BREAKER_MAX
+BREAKER_MAX = 300.0
+FAILURE_MEMORY = 60.0  # a mirror that failed is ranked down for this long
+
+PROBE_BYTES = 64 << 10
+PROBE_TIMEOUT = 3
+TYPICAL_SIZE = 1 << 20  # ranking weighs rtt and throughput as if fetching this much
+EMA_WEIGHT = 0.3
+
+
+def backoff_delay(attempt):
+    # "full jitter": spreads the retries of many launchers hitting one broken host
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+class Mirror:
+    def __init__(self, base):
+        self.base = base
+        self.rtt = None
+        self.throughput = None
+        self.active = 0
+        self.failures = 0
+        self.opened = 0
+        self.open_until = 0.0
+        self.failed_at = None
+        self.served = 0
+
+    def rewrite(self, url, origin):
+        return self.base + url[len(origin):]
+
+    def available(self, now):
+        # half open once the cooldown passes: the next request is the trial
+        return now >= self.open_until
+
+    def cost(self):
+        # expected seconds for a typical file, shared with the transfers in flight
+        rtt = self.rtt if self.rtt is not None else 0.2
+        throughput = self.throughput or 1 << 20
+        cost = (rtt + TYPICAL_SIZE / throughput) * (1 + self.active)
+        if self.failed_at is not None and time.monotonic() - self.failed_at < FAILURE_MEMORY:
+            cost *= 1 + self.failures
+
+        return cost
+
+    def observe(self, ok, elapsed, size=None):
+        if not ok:
+            self.failures += 1
+            self.failed_at = time.monotonic()
+            if self.failures >= BREAKER_FAILURES:
+                self.open_until = time.monotonic() + min(BREAKER_MAX, BREAKER_COOLDOWN * 2 ** self.opened)
+                self.opened += 1
+            return
+
+        self.failures = 0
+        self.opened = 0
+        self.open_until = 0.0
+        self.served += 1
+        if size:
+            # small files say more about latency than bandwidth
+            if size >= PROBE_BYTES:
+                self.throughput = _ema(self.throughput, size / max(elapsed, 1e-3))
+            else:
+                self.rtt = _ema(self.rtt, elapsed)
+
+    def __repr__(self):
+        return f"<{type(self).__name__}: {self.base} rtt={self.rtt} throughput={self.throughput}>"
+
+
+def _ema(old, value):
+    return value if old is None else old + EMA_WEIGHT * (value - old)
+
+
+class MirrorGroup:
+    # one origin prefix and the prefixes that serve the same paths
+    def __init__(self, origin, mirrors=()):
+        self.origin = origin
+        self.mirrors = [Mirror(origin)]
+        self.add(mirrors)
+        self._lock = threading.Lock()
+        self._probed = False
+
+    def add(self, mirrors):
+        known = {mirror.base for mirror in self.mirrors}
+        for base in mirrors:
+            if base not in known:
+                self.mirrors.append(Mirror(base))
+                known.add(base)
+
+    def probe(self, url):
+        # one ranged GET per mirror, in parallel: time to first byte and a throughput sample
+        from nupdate.utils import get_session
+
+        def measure(mirror: Mirror):
+            headers = {'Range': f'bytes=0-{PROBE_BYTES - 1}'}
+            start = time.monotonic()
+            try:
+                req = get_session().get(mirror.rewrite(url, self.origin), headers=headers,
+                                        stream=True, timeout=PROBE_TIMEOUT)
+                first = time.monotonic()
+                size = 0
+                with req:
+                    for chunk in req.iter_content(chunk_size=PROBE_BYTES):
+                        size += len(chunk)
+                        if size >= PROBE_BYTES:
+                            break  # the mirror ignored the range
+                ok = req.status_code in (200, 206)
+            except Exception:
+                ok = False
+
+            with self._lock:
+                if not ok:
+                    mirror.observe(False, 0)
+                    return
+
+                mirror.rtt = first - start
+                mirror.throughput = size / max(time.monotonic() - first, 1e-3) if size >= PROBE_BYTES else None
+
+        with ThreadPoolExecutor(max_workers=len(self.mirrors)) as executor:
+            list(executor.map(measure, self.mirrors))
+
+    def acquire(self, url, exclude=()) -> Mirror:
+        if len(self.mirrors) > 1:
+            with self._lock:
+                probe, self._probed = not self._probed, True
+            if probe:
+                self.probe(url)
+
+        with self._lock:
+            now = time.monotonic()
+            healthy = [mirror for mirror in self.mirrors if mirror.available(now)]
+            candidates = [mirror for mirror in healthy if mirror not in exclude] or healthy
+            if candidates:
+                mirror = min(candidates, key=Mirror.cost)
+            else:
+                # every circuit is open; try the one that reopens first rather than stall
+                mirror = min(self.mirrors, key=lambda item: item.open_until)
+
+            mirror.active += 1
+            return mirror
+
+    def release(self, mirror: Mirror, ok, elapsed, size=None):
+        with self._lock:
+            mirror.active -= 1
+            mirror.observe(ok, elapsed, size)
+
+
+_groups = {}
+_groups_lock = threading.Lock()
+_seeded = False
+
+
+def _seed():
+    global _seeded
+    if not _seeded:
+        from nupdate.config import MIRRORS
+
+        _seeded = True
+        for origin, mirrors in MIRRORS.items():
+            _groups.setdefault(origin, MirrorGroup(origin)).add(mirrors)
+
+
+# each source maps an origin prefix to its mirror prefixes:
+# config.MIRRORS (always), options.txt "mirrors" and index.json "mirrors"
+def configure_mirrors(*sources):
+    with _groups_lock:
+        _seed()
+        for source in sources:
+            for origin, mirrors in (source or {}).items():
+                if isinstance(mirrors, str):
+                    mirrors = [mirrors]
+
+                group = _groups.get(origin)
+                if group is None:
+                    _groups[origin] = MirrorGroup(origin, mirrors)
+                else:
+                    group.add(mirrors)
+
+    return get_mirrors()
+
+
+def get_mirrors():
+    with _groups_lock:
+        return {origin: [mirror.base for mirror in group.mirrors] for origin, group in _groups.items()}
+
+
+def get_usage():
+    # {mirror prefix: files it served} for the mirrors that served any
+    with _groups_lock:
+        return {
+            mirror.base: mirror.served
+            for group in _groups.values() for mirror in group.mirrors if mirror.served
+        }
+
+
+def get_group(url) -> MirrorGroup:
+    with _groups_lock:
+        _seed()
+        matches = [origin for origin in _groups if url.startswith(origin)]
+        return _groups[max(matches, key=len)] if matches else None
+
+
+# calls attempt(url) with the url rewritten for the best mirror until it returns the
+# number of bytes it got (may be 0); None or an exception is a failure.
+def network_errors():
+    # what a failed transfer raises; anything else is a bug, not a reason to try a mirror
+    import requests
+    from hyper.http20.exceptions import HTTP20Error
+
+    return OSError, requests.RequestException, HTTP20Error
+
+
+def with_mirrors(url, attempt):
+    from nupdate.progress import get_progress
+
+    errors = network_errors()
+    group = get_group(url)
+    attempts = FETCH_ATTEMPTS + (len(group.mirrors) - 1 if group else 0)
+
+    failed = set()
+    rounds = 0
+    for index in range(attempts):
+        # moving to another mirror is immediate; back off once every mirror failed
+        if index and (group is None or len(failed) >= len(group.mirrors)):
+            time.sleep(backoff_delay(rounds))
+            rounds += 1
+            failed.clear()
+
+        mirror = group.acquire(url, failed) if group is not None else None
+        target = mirror.rewrite(url, group.origin) if mirror is not None else url
+
+        start = time.monotonic()
+        try:
+            size = attempt(target)
+        except errors as e:
+            get_progress().message('err', e, target)
+            size = None
+
+        if mirror is not None:
+            group.release(mirror, size is not None, time.monotonic() - start, size)
+            failed.add(mirror)
+
+        if size is not None:
+            return True
+
+    return False
@@ -1,20 +1,19 @@
 import json
 import os
 from pathlib import Path
-from typing import Mapping
-
-import requests
+from typing import TYPE_CHECKING, Mapping
 
 from nupdate.config import MOJANG_RESOURCES_URL
 from nupdate.mojang.utils import FileSystemMapping
-from nupdate.utils import Namespace, calc_sha1_hash, Fetchable
+from nupdate.utils import Namespace, Sha1Fetchable, fetch_bytes
 
-if False:
+if TYPE_CHECKING:
     from nupdate.mojang.minecraft import MojangMinecraftPackage
 
 
-class Asset(Fetchable):
+class Asset(Sha1Fetchable):
     __slots__ = "name", "info"
+    section = 'assets'
 
     def __init__(self, name, info):
         self.name = name
@@ -33,20 +32,14 @@ class Asset(Fetchable):
     def path(self):
         return f'assets/objects/{self._path}'
 
-    def _check(self, path):
-        obj_hash = self.info['hash']
-        obj_size = self.info['size']
-
-        if not path.exists():
-            return False
-
-        if path.stat().st_size != obj_size:
-            return False
-
-        if calc_sha1_hash(path) != obj_hash.lower():
-            return False
+    @property
+    def sha1(self):
+        # mojang only publishes sha1 for asset objects
+        return self.info['hash']
 
-        return True
+    @property
+    def size(self):
+        return self.info['size']
 
     def __repr__(self):
         return f"<{type(self).__name__}: {self.name}>"
@@ -84,7 +77,7 @@ class MojangAssetIndexes(FileSystemMapping, Mapping[str, MojangAssets]):
             pass
 
         version_json_path = self._get_json_path(version)
-        raw_data = requests.get(url).text
+        raw_data = fetch_bytes(url)[1].decode('utf-8')
 
         try:
             json.loads(raw_data)
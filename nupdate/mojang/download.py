@@ -1,6 +1,8 @@
+from typing import TYPE_CHECKING
+
 from nupdate.utils import Namespace, NSFileFetchable
 
-if False:
+if TYPE_CHECKING:
     from nupdate.mojang.minecraft import MojangMinecraftJson
 
 
@@ -9,6 +11,10 @@ class MojangDownload(NSFileFetchable, Namespace):
     def path(self) -> str:
         raise NotImplementedError
 
+    @property
+    def section(self):
+        return 'assets' if self.path.startswith('assets/') else 'libraries'
+
 
 class SingleDownload(MojangDownload):
     def __init__(self, data, mc: "MojangMinecraftJson", path):
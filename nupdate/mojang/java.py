@@ -1,18 +1,22 @@
-import lzma
+import json
 import os
 import platform
-import zipfile
+import shutil
 from pathlib import Path
 from urllib.parse import urlparse
 
-import requests
-
 from nupdate.config import OS_NAME
-from nupdate.utils import Namespace, mktemp, fetch, calc_sha1_hash
+from nupdate.utils import Namespace, NSFileFetchable, mktemp, fetch, calc_sha1_hash
+from nupdate.verify import VerifyPolicy, get_policy, verify_entries
+
+
+class RuntimeFile(NSFileFetchable):
+    section = 'runtime'
 
 
 class MojangJava(Namespace):
     LAUNCHER_CONFIG_URL = "http://launchermeta.mojang.com/mc/launcher.json"
+    RUNTIME_MANIFEST = "runtime.json"
 
     def __init__(self, path: Path):
         self.path = Path(path)
@@ -22,6 +26,14 @@ class MojangJava(Namespace):
         return self.sequence()
 
     def sequence(self):
+        from nupdate.progress import get_progress
+
+        policy = get_policy('runtime')
+        for _, _, _, folder in self.find_runtime():
+            if not self.verify(folder, policy):
+                get_progress().message("broken runtime", folder)
+                shutil.rmtree(str(folder))
+
         runtime = self.runtime
         if not runtime:
             self.fetch_info()
@@ -33,10 +45,15 @@ class MojangJava(Namespace):
         return self.runtime
 
     def fetch_info(self):
+        import requests
+
         data = requests.get(self.LAUNCHER_CONFIG_URL).json()
         self.update(data)
 
     def download(self, osname, arch, jname):
+        import lzma
+        import zipfile
+
         farch = {'x86': '32', 'x64': '64'}.get(arch)
         info = self[osname][farch][jname]
         url = info['url']
@@ -61,8 +78,25 @@ class MojangJava(Namespace):
                 path.mkdir(parents=True, exist_ok=True)
                 zf.extractall(path)
 
+                files = {}
+                for name in zf.namelist():
+                    file = path / name
+                    if file.is_file():
+                        files[name] = {'sha1': calc_sha1_hash(file), 'size': file.stat().st_size}
+
+        (path / self.RUNTIME_MANIFEST).write_text(json.dumps(files, indent=2))
         return True
 
+    def verify(self, folder: Path, policy: VerifyPolicy):
+        manifest = folder / self.RUNTIME_MANIFEST
+        if not manifest.exists():
+            # runtimes installed before the manifest existed: no way to vaild
+            return True
+
+        entries = [(RuntimeFile(dict(info, path=name)), folder)
+                   for name, info in json.loads(manifest.read_text()).items()]
+        return not verify_entries(entries, policy)
+
     def _get_arch(self):
         arch = {'i386': 'x86', 'AMD64': 'x64'}.get(platform.machine(), 'x86')
         return arch
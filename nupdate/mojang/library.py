@@ -1,12 +1,13 @@
 import platform
 from pathlib import Path
+from typing import TYPE_CHECKING
 from urllib.parse import urljoin
 
 from nupdate.config import OS_NAME
 from nupdate.mojang.download import MojangDownload
 from nupdate.utils import Namespace, Fetchable
 
-if False:
+if TYPE_CHECKING:
     from nupdate.mojang.minecraft import MojangMinecraftJson
 
 
@@ -119,30 +120,33 @@ class MojangLibrary(Namespace):
 
         return None
 
-    def download(self):
+    def fetchables(self):
         action = self.action
         if action == "allow":
             for download in self.downloads:
-                if isinstance(download, ArtifactDownload):
-                    download(self.mc.path)
-                elif isinstance(download, MavenDownload):
-                    download(self.mc.path)
+                if isinstance(download, (ArtifactDownload, MavenDownload)):
+                    yield download
                 else:
                     raise Exception
 
             if self.natives:
-                download = self.native
-                download(self.mc.path)
+                yield self.native
         elif action == 'disallow':
             return
         else:
             raise Exception
 
+    def download(self):
+        for download in self.fetchables():
+            download(self.mc.path)
+
     def __repr__(self):
         return f"<{type(self).__name__}: {self.name}>"
 
 
 class LibraryDownload(Fetchable, Namespace):
+    section = 'libraries'
+
     @property
     def path(self):
         return f"libraries/{self['path']}"
@@ -190,7 +194,7 @@ class MavenDownload(LibraryDownload):
     def _fetch(self, path: Path):
         return True
 
-    def _check(self, path: Path):
+    def _check(self, path: Path, policy=None):
         return True
 
     @staticmethod
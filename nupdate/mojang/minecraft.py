@@ -9,6 +9,8 @@ from nupdate.mojang.library import MojangLibrary
 from nupdate.mojang.profile import MojangLauncherProfileJson
 from nupdate.mojang.utils import FileSystemMapping
 from nupdate.utils import Namespace
+from nupdate.trace import span
+from nupdate.verify import repair_entries
 
 
 class MojangMinecraftJson(Namespace):
@@ -76,18 +78,31 @@ class MojangMinecraftJson(Namespace):
         return self.sequence()
 
     def sequence(self):
-        self.assetIndex.download()
-        self.client.download()
+        # the asset list is read from the index, so it has to be in place first
+        with span("asset_index"):
+            self.assetIndex.download()
+        with span("repair"):
+            repair_entries(self.entries())
 
-        for library in self.libraries:  # type: MojangLibrary
-            library.download()
+        with span("natives"):
+            self.extract_natives()
 
-        for asset in self.assets:
-            asset.download(self.path)
+        return True
 
-        self.extract_natives()
+    def entries(self):
+        entries = [(self.assetIndex, self.path), (self.client, self.path)]
 
-        return True
+        for library in self.libraries:  # type: MojangLibrary
+            entries.extend((download, self.path) for download in library.fetchables())
+
+        try:
+            assets = self.assets
+        except KeyError:
+            pass  # index missing; only the index itself can be checked
+        else:
+            entries.extend((asset, self.path) for asset in assets)
+
+        return entries
 
     def extract_natives(self):
         for library in self.libraries:
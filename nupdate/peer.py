@@ -0,0 +1,273 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from nupdate.fileio import hash_file, stream_chunk_size
+from nupdate.serve import OriginServer, Resource
+
+PEER_PORT = 24680
+DISCOVERY_PORT = 24681
+DISCOVERY_TIMEOUT = 0.5
+PEER_TIMEOUT = 3
+PEER_FAILURES = 3  # a peer is dropped for this launch after this many failures
+
+DISCOVER = b"nupdate-peer?"
+INSTANCE = uuid.uuid4().hex  # lets discovery skip our own answer
+
+_peers = []
+_failures = {}
+_lock = threading.Lock()
+_server = None
+
+
+class PeerIndex:
+    # sha1 => local file; a file is hashed once before it is first served and again
+    # only when its size or mtime moves, so a peer never serves what it can't vouch for
+    def __init__(self):
+        self.paths = {}
+        self._verified = {}
+        self._lock = threading.Lock()
+
+    def add_entries(self, entries):
+        for fetchable, basepath in entries:
+            sha1 = (getattr(fetchable, 'hashes', None) or {}).get('sha1')
+            if sha1:
+                self.paths[sha1.lower()] = basepath / fetchable.path
+
+        return self
+
+    def replace_entries(self, entries):
+        # a new launch's files; what was hashed before stays vouched for if its path held
+        fresh = PeerIndex().add_entries(entries)
+        with self._lock:
+            self._verified = {
+                sha1: key for sha1, key in self._verified.items() if fresh.paths.get(sha1) == self.paths.get(sha1)
+            }
+            self.paths = fresh.paths
+
+        return self
+
+    def lookup(self, sha1) -> Path:
+        path = self.paths.get(sha1)
+        if path is None:
+            return None
+
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+
+        key = stat.st_size, stat.st_mtime_ns
+        with self._lock:
+            if self._verified.get(sha1) == key:
+                return path
+
+        if hash_file(path, 'sha1') != sha1:
+            return None
+
+        with self._lock:
+            self._verified[sha1] = key
+
+        return path
+
+
+class PeerServer(OriginServer):
+    # serves /sha1/<hex> out of a PeerIndex; no manifests, no pre-compressed variants
+    variants = ()
+
+    def __init__(self, index: PeerIndex):
+        super().__init__(Path.cwd(), "/sha1/", cache_size=0)
+        self.index = index
+
+    async def _resolve(self, url_path):
+        if not url_path.startswith(self.prefix):
+            return None
+
+        sha1 = url_path[len(self.prefix):].lower()
+        path = await asyncio.get_event_loop().run_in_executor(None, self.index.lookup, sha1)
+        if path is None:
+            return None
+
+        return Resource(path, None, sha1, "public, max-age=31536000, immutable")
+
+
+class DiscoveryProtocol(asyncio.DatagramProtocol):
+    def __init__(self, port):
+        self.port = port
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if data == DISCOVER:
+            reply = {"peer": INSTANCE, "port": self.port}
+            self.transport.sendto(json.dumps(reply).encode('utf-8'), addr)
+
+
+def start_peer_server(entries, port=None, host="0.0.0.0") -> PeerServer:
+    # serve in a daemon thread for as long as the launcher process lives; one server per
+    # process, a resident launcher's later launches only replace what it shares
+    global _server
+    if _server is not None:
+        _server.index.replace_entries(entries)
+        return _server
+
+    server = PeerServer(PeerIndex().add_entries(entries))
+    try:
+        server.listen(host, port or PEER_PORT)
+    except OSError:
+        server.listen(host, 0)  # another launcher on this machine has the port
+    _server = server
+
+    loop = asyncio.new_event_loop()
+
+    def run():
+        asyncio.set_event_loop(loop)
+
+        udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            udp.bind((host, DISCOVERY_PORT))
+        except OSError:
+            udp.close()  # still reachable through a configured peer list
+        else:
+            loop.run_until_complete(loop.create_datagram_endpoint(
+                lambda: DiscoveryProtocol(server.address[1]), sock=udp))
+
+        loop.run_until_complete(server.serve_forever())
+
+    threading.Thread(target=run, name="nupdate-peer", daemon=True).start()
+    return server
+
+
+def discover_peers(timeout=DISCOVERY_TIMEOUT, port=DISCOVERY_PORT):
+    found = []
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.settimeout(timeout)
+        sock.sendto(DISCOVER, ("<broadcast>", port))
+
+        deadline = time.monotonic() + timeout
+        while True:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+
+            sock.settimeout(left)
+            try:
+                data, (addr, _) = sock.recvfrom(1024)
+            except socket.timeout:
+                break
+
+            try:
+                reply = json.loads(data.decode('utf-8'))
+            except ValueError:
+                continue
+
+            if isinstance(reply, dict) and reply.get("peer") != INSTANCE and reply.get("port"):
+                found.append(f"http://{addr}:{int(reply['port'])}")
+    except OSError:
+        pass  # no broadcast route (offline, vpn only)
+    finally:
+        sock.close()
+
+    return found
+
+
+# options.txt "peers": true discovers peers on the lan, a list of "host:port" adds fixed ones
+def configure_peers(options=None):
+    options = options or {}
+    setting = options.get("peers")
+
+    peers = []
+    if setting:
+        if isinstance(setting, list):
+            peers.extend(peer if "://" in peer else f"http://{peer}" for peer in setting)
+
+        peers.extend(peer for peer in discover_peers() if peer not in peers)
+
+    with _lock:
+        _peers[:] = peers
+        _failures.clear()
+
+    return list(peers)
+
+
+def get_peers():
+    with _lock:
+        return list(_peers)
+
+
+def _failed(peer):
+    with _lock:
+        _failures[peer] = _failures.get(peer, 0) + 1
+        if _failures[peer] >= PEER_FAILURES and peer in _peers:
+            _peers.remove(peer)
+
+
+# try each peer for the file; `check` must verify it against the origin manifest with a
+# cryptographic hash, so a peer can only save bandwidth, never decide what ends up on
+# disk. `size` (the manifest's) caps what a peer may stream.
+def fetch_from_peers(sha1, path: Path, check, size=None):
+    peers = get_peers()
+    if not peers:
+        return False
+
+    from nupdate.progress import get_progress
+    from nupdate.utils import get_session
+
+    progress = get_progress()
+    for peer in peers:
+        try:
+            req = get_session().get(f"{peer}/sha1/{sha1.lower()}", stream=True, timeout=PEER_TIMEOUT)
+        except Exception:
+            _failed(peer)
+            continue
+
+        if req.status_code != 200:
+            req.close()
+            continue  # the peer doesn't have it, which is not its fault
+
+        total_length = req.headers.get('content-length')
+        expected_size = int(total_length) if total_length and total_length.isdigit() else None
+        if size is not None and expected_size is not None and expected_size != size:
+            req.close()
+            progress.message('peer sent a bad file', peer, sha1)
+            _failed(peer)
+            continue
+
+        transfer = progress.begin(expected_size if expected_size is not None else size)
+        ok = False
+        try:
+            written = 0
+            with path.open('wb') as fp:
+                for chunk in req.iter_content(chunk_size=stream_chunk_size(size or expected_size)):
+                    written += len(chunk)
+                    if size is not None and written > size:
+                        raise ValueError("more than the manifest size")
+
+                    fp.write(chunk)
+                    transfer.update(len(chunk))
+
+            ok = check(path)
+        except Exception:
+            ok = False
+        finally:
+            req.close()
+            transfer.finish(ok)
+
+        if ok:
+            return True
+
+        progress.message('peer sent a bad file', peer, sha1)
+        _failed(peer)
+        if path.exists():
+            path.unlink()
+
+    return False
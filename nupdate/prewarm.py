@@ -0,0 +1,159 @@
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+READ_CHUNK = 1 << 20
+READ_WORKERS = 4  # keeps an hdd's queue full enough to reorder; ssds need no more
+BUDGET_RAM_FRACTION = 8  # of physical memory, so the cache never evicts the game itself
+MAX_BUDGET_MB = 2048
+WORKER_IDLE = 1.0  # workers leave once the queue stays empty this long
+
+# forge logs this once every mod finished loading, right before the main menu
+MENU_MARKER = "Forge Mod Loader has successfully loaded"
+MENU_TIMEOUT = 600
+MENU_POLL = 0.5
+
+
+def default_budget_mb():
+    from nupdate.jvm import host_memory_mb
+
+    return min(MAX_BUDGET_MB, host_memory_mb() // BUDGET_RAM_FRACTION)
+
+
+class Prewarmer:
+    # pulls jars into the page cache from background threads while the launcher does
+    # other work: posix_fadvise(WILLNEED) where there is one (the kernel reads ahead on
+    # its own), plain sequential reads elsewhere. files past the budget are left cold.
+    def __init__(self, budget_mb=None, workers=READ_WORKERS):
+        self.budget = (budget_mb or default_budget_mb()) << 20
+        self.mode = "fadvise" if hasattr(os, "posix_fadvise") else "read"
+        self.queued = 0
+        self.files = 0
+        self.bytes = 0
+        self.over_budget = 0
+        self.errors = 0
+        self.started = time.monotonic()
+        self.finished = None
+        self._seen = set()
+        self._pending = 0
+        self._stop = False
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._workers = workers
+        self._running = 0
+
+    def add(self, paths):
+        for path in paths:
+            path = Path(path)
+            try:
+                size = path.stat().st_size
+            except OSError:
+                continue
+
+            with self._lock:
+                if path in self._seen:
+                    continue
+                self._seen.add(path)
+
+                if self.queued + size > self.budget:
+                    self.over_budget += 1
+                    continue
+
+                self.queued += size
+                self._pending += 1
+                self.finished = None
+
+            self._queue.put((path, size))
+            with self._lock:
+                if self._running < self._workers:
+                    self._running += 1
+                    threading.Thread(target=self._worker, name=f"prewarm-{self._running}", daemon=True).start()
+
+    def add_tree(self, folder: Path, pattern="*.jar"):
+        if folder.is_dir():
+            self.add(sorted(folder.rglob(pattern)))
+
+    def _worker(self):
+        while True:
+            try:
+                path, size = self._queue.get(timeout=WORKER_IDLE)
+            except queue.Empty:
+                with self._lock:
+                    if self._queue.empty():
+                        self._running -= 1
+                        return
+                continue
+
+            try:
+                if not self._stop:
+                    self._warm(path)
+                ok = True
+            except OSError:
+                ok = False
+
+            with self._lock:
+                if ok:
+                    self.files += 1
+                    self.bytes += size
+                else:
+                    self.errors += 1
+
+                self._pending -= 1
+                if not self._pending:
+                    self.finished = time.monotonic()
+
+    def _warm(self, path: Path):
+        with path.open('rb') as fp:
+            if self.mode == "fadvise":
+                os.posix_fadvise(fp.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+            else:
+                while not self._stop and fp.read(READ_CHUNK):
+                    pass
+
+    def stop(self):
+        self._stop = True
+
+    @property
+    def done(self):
+        return self.finished is not None
+
+    def describe(self):
+        with self._lock:
+            elapsed = (self.finished or time.monotonic()) - self.started
+            state = "done" if self.finished is not None else f"{self._pending} files still queued"
+            return (f"{self.files} files, {self.bytes / (1 << 20):.1f} MiB in {elapsed:.2f}s by {self.mode}, "
+                    f"{self.over_budget} over the {self.budget >> 20} MiB budget, {state}")
+
+
+def watch_menu(log_file: Path, since, report, timeout=MENU_TIMEOUT):
+    # time to menu, read off the game's own log: report(seconds) once forge says it is
+    # done, after since (a time.time()) so the previous run's log is not mistaken for it
+    def run():
+        deadline = time.monotonic() + timeout
+        marker = MENU_MARKER.encode('utf-8')
+        offset, tail = 0, b""
+        while time.monotonic() < deadline:
+            try:
+                stat = log_file.stat()
+                if stat.st_mtime >= since:
+                    if stat.st_size < offset:
+                        offset, tail = 0, b""  # rotated under us
+                    with log_file.open('rb') as fp:
+                        fp.seek(offset)
+                        chunk = fp.read()
+                    offset += len(chunk)
+                    data = tail + chunk
+                    if marker in data:
+                        report(time.time() - since)
+                        return
+                    tail = data[-len(marker):]
+            except OSError:
+                pass
+
+            time.sleep(MENU_POLL)
+
+    thread = threading.Thread(target=run, name="menu-watch", daemon=True)
+    thread.start()
+    return thread
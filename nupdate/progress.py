@@ -0,0 +1,207 @@
+import json
+import sys
+import threading
+import time
+
+
+def format_size(size):
+    for unit in "B", "KiB", "MiB", "GiB":
+        if abs(size) < 1024 or unit == "GiB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
+        size /= 1024
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}" if hours else f"{minutes:02}:{seconds:02}"
+
+
+class Transfer:
+    __slots__ = "progress", "size", "received", "reserved"
+
+    def __init__(self, progress: "TransferProgress", size, reserved):
+        self.progress = progress
+        self.size = size
+        self.received = 0
+        self.reserved = reserved
+
+    def update(self, length):
+        self.received += length
+        self.progress._advance(length)
+
+    def finish(self, ok=True):
+        self.progress._end(self, ok)
+
+
+class TransferProgress:
+    TTY_INTERVAL = 0.25
+    LINE_INTERVAL = 5.0
+
+    def __init__(self, stream=None, interval=None):
+        self.stream = stream if stream is not None else sys.stdout
+        try:
+            self.tty = self.stream.isatty()
+        except (AttributeError, ValueError):
+            self.tty = False
+
+        if interval is None:
+            interval = self.TTY_INTERVAL if self.tty else self.LINE_INTERVAL
+
+        self.interval = interval
+        self.files_total = 0
+        self.files_done = 0
+        self.files_failed = 0
+        self.bytes_total = 0
+        self.bytes_done = 0
+        self.active = 0
+        self.rate = None
+
+        self._lock = threading.Lock()
+        self._reserved = 0
+        self._started = None
+        self._next_render = 0.0
+        self._last_time = None
+        self._last_bytes = 0
+        self._line_width = 0
+
+    def expect(self, files, size):
+        # announce planned transfers so that totals and ETA are known up front
+        with self._lock:
+            self.files_total += files
+            self.bytes_total += size
+            self._reserved += files
+
+    def begin(self, size=None) -> Transfer:
+        with self._lock:
+            if self._started is None:
+                self._started = self._last_time = time.monotonic()
+
+            reserved = self._reserved > 0
+            if reserved:
+                self._reserved -= 1
+            else:
+                self.files_total += 1
+                self.bytes_total += size or 0
+
+            self.active += 1
+
+        return Transfer(self, size, reserved)
+
+    def _advance(self, length):
+        with self._lock:
+            self.bytes_done += length
+            now = time.monotonic()
+            if now >= self._next_render:
+                self._render(now)
+
+    def _end(self, transfer: Transfer, ok):
+        with self._lock:
+            self.active -= 1
+            if ok:
+                self.files_done += 1
+                if transfer.size is None and not transfer.reserved:
+                    self.bytes_total += transfer.received
+            else:
+                # retried transfers start over; failed ones leave the totals
+                self.bytes_done -= transfer.received
+                if transfer.reserved:
+                    self._reserved += 1
+                else:
+                    self.files_total -= 1
+                    self.bytes_total -= transfer.size or 0
+
+    def fail(self):
+        with self._lock:
+            self.files_failed += 1
+
+    def message(self, *args):
+        with self._lock:
+            self._clear()
+            print(*args, file=self.stream)
+            self._next_render = 0.0
+
+    def finish(self):
+        with self._lock:
+            if self._started is None:
+                return
+
+            self._render(time.monotonic(), final=True)
+            self._started = None
+
+    def snapshot(self, now=None):
+        if now is None:
+            now = time.monotonic()
+
+        elapsed = now - self._started if self._started is not None else 0.0
+        remaining = max(self.bytes_total - self.bytes_done, 0)
+        rate = self.rate
+        if rate is None and elapsed > 0:
+            rate = self.bytes_done / elapsed
+
+        return {
+            "files_done": self.files_done,
+            "files_total": self.files_total,
+            "files_failed": self.files_failed,
+            "bytes_done": self.bytes_done,
+            "bytes_total": self.bytes_total,
+            "active": self.active,
+            "elapsed": round(elapsed, 3),
+            "rate": round(rate or 0.0, 1),
+            "eta": round(remaining / rate, 1) if rate else None,
+        }
+
+    def _render(self, now, final=False):
+        if self._last_time is not None and now > self._last_time:
+            rate = max(self.bytes_done - self._last_bytes, 0) / (now - self._last_time)
+            self.rate = rate if self.rate is None else self.rate * 0.7 + rate * 0.3
+
+        self._last_time = now
+        self._last_bytes = self.bytes_done
+        self._next_render = now + self.interval
+
+        info = self.snapshot(now)
+        if self.tty:
+            line = (f"[{info['files_done']}/{info['files_total']} files] "
+                    f"{format_size(info['bytes_done'])} / {format_size(info['bytes_total'])} "
+                    f"{format_size(info['rate'])}/s ETA {format_eta(info['eta'])}")
+            self._clear()
+            self.stream.write(line + ("\n" if final else ""))
+            self._line_width = 0 if final else len(line)
+        else:
+            info["event"] = "done" if final else "progress"
+            self.stream.write(json.dumps(info, sort_keys=True) + "\n")
+
+        self.stream.flush()
+
+    def _clear(self):
+        if self._line_width:
+            self.stream.write("\r" + " " * self._line_width + "\r")
+            self._line_width = 0
+
+
+_progress: TransferProgress = None
+
+
+def get_progress() -> TransferProgress:
+    global _progress
+    if _progress is None:
+        _progress = TransferProgress()
+
+    return _progress
+
+
+def set_progress(progress: TransferProgress):
+    # a resident launcher points the progress of a launch at its client's stream
+    global _progress
+    _progress = progress
+
+
+def finish_progress():
+    global _progress
+    progress, _progress = _progress, None
+    if progress is not None:
+        progress.finish()
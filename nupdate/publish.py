@@ -0,0 +1,311 @@
+import argparse
+import base64
+import hashlib
+import json
+import posixpath
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from nupdate.build import build_main
+from nupdate.journal import FETCHED, UpdateJournal
+from nupdate.utils import calc_sha1_hash
+
+if TYPE_CHECKING:
+    import paramiko
+
+SITE = "https://mc.nyang.kr/"
+HOST = "mc.nyang.kr"
+USERNAME = "signet"
+REMOTE_ROOT = "/home/signet/web/"
+
+# Note. this is not password
+SERVER_AUTH_KEY = b'AAAAB3NzaC1yc2EAAAADAQABAAABAQDILRxAzEUdZZU9zNXJTF8L5UAuZKW0nsSF3yBfOM0U8bHt98Qa8v5FELRnbLYXcCK3x9UJ55O9U5VnX4tKEiSoXc3IoxfQrQfTuOpMJsvpAbfRrIFKSrRTBD3VoCWB4gBpuQEGzrhZW9VIV3nFiufuu0dMzmJyuPcWbYmoTlpAiyzs/68GuXW82DuPCv69X3LD2GCcSqZ6lA8P8JNwXuIbAEZMfBq/Ts8QV8TNHdV9uE/FjZa1a6vpporf+2C34Mk/pesqROBL2UsZUEDbL1S1kbHXwMr5Wn3q8tr+n+TRsYItRP0J7vjTdDbBcTrIAKCabCuwCTjLdD2j9dC/Mi47'
+
+CHANNELS = 4
+RECONNECTS = 5
+UPLOAD_CHUNK = 1 << 20
+MANIFEST_NAMES = ("modpack.json", "index.json")  # uploaded last, in this order
+VARIANT_SUFFIXES = (".gz", ".br")
+
+
+def connect(key_file="ssh-rsa.key") -> "paramiko.SSHClient":
+    import paramiko
+
+    skey = paramiko.RSAKey(data=base64.b64decode(SERVER_AUTH_KEY))
+    key = paramiko.RSAKey(filename=key_file)
+
+    client = paramiko.SSHClient()
+    client.get_host_keys().add(HOST, 'ssh-rsa', skey)
+    client.connect(HOST, username=USERNAME, pkey=key)
+    return client
+
+
+def manifest_files(data, site=SITE):
+    # every {"url", "sha1"} under the site in a manifest: files, bundles, libraries, packages
+    found = {}
+
+    def walk(node):
+        if isinstance(node, dict):
+            url, sha1 = node.get('url'), node.get('sha1')
+            if isinstance(url, str) and url.startswith(site) and sha1:
+                found[url[len(site):]] = sha1.lower()
+
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(data)
+    return found
+
+
+class Publisher:
+    # one transport, one sftp channel per worker thread; every file goes to
+    # "<name>.<sha1>.part" first (appended to if a dropped run left one for the same
+    # content) and is renamed in place
+    def __init__(self, client: "paramiko.SSHClient", remote_root=REMOTE_ROOT, channels=CHANNELS):
+        self.client = client
+        self.remote_root = remote_root
+        self.channels = channels
+        self.uploaded = 0
+        self._local = threading.local()
+        self._sftps = []
+        self._dirs = set()
+        self._lock = threading.Lock()
+
+    def sftp(self) -> "paramiko.SFTPClient":
+        sftp = getattr(self._local, 'sftp', None)
+        if sftp is None:
+            sftp = self._local.sftp = self.client.open_sftp()
+            with self._lock:
+                self._sftps.append(sftp)
+
+        return sftp
+
+    def close(self):
+        for sftp in self._sftps:
+            sftp.close()
+        self._sftps.clear()
+        self._local = threading.local()
+
+    def remote_path(self, rpath):
+        return posixpath.join(self.remote_root, rpath)
+
+    def read_json(self, rpath):
+        try:
+            with self.sftp().open(self.remote_path(rpath), 'rb') as fp:
+                return json.loads(fp.read().decode('utf-8'))
+        except (IOError, ValueError):
+            return None
+
+    def makedirs(self, dirname):
+        if dirname in self._dirs:
+            return
+
+        sftp = self.sftp()
+        parts = dirname.strip('/').split('/')
+        for index in range(1, len(parts) + 1):
+            path = '/' + '/'.join(parts[:index])
+            if path in self._dirs:
+                continue
+
+            try:
+                sftp.stat(path)
+            except IOError:
+                try:
+                    sftp.mkdir(path)
+                except IOError:
+                    sftp.stat(path)  # another channel made it first
+
+            with self._lock:
+                self._dirs.add(path)
+
+    def upload(self, local: Path, remote: str):
+        sftp = self.sftp()
+        self.makedirs(posixpath.dirname(remote))
+
+        size = local.stat().st_size
+        sha1 = calc_sha1_hash(local)
+        # keyed on the content: a part left for what the file held before is never resumed
+        tpath = f"{remote}.{sha1}.part"
+        try:
+            offset = sftp.stat(tpath).st_size
+        except IOError:
+            offset = 0
+
+        if offset > size:
+            offset = 0
+
+        hobj = hashlib.sha1()
+        with local.open('rb') as src:
+            if offset and not self._same_prefix(src, tpath, offset, hobj):
+                offset = 0  # the dropped run read the file while it changed
+                src.seek(0)
+                hobj = hashlib.sha1()
+
+            with sftp.open(tpath, 'ab' if offset else 'wb') as dst:
+                dst.set_pipelined(True)
+                for chunk in iter(lambda: src.read(UPLOAD_CHUNK), b''):
+                    hobj.update(chunk)
+                    dst.write(chunk)
+
+        if hobj.hexdigest() != sha1:
+            sftp.remove(tpath)
+            raise IOError(f"changed while uploading: {remote}")
+
+        if sftp.stat(tpath).st_size != size:
+            raise IOError(f"short upload: {remote}")
+
+        sftp.posix_rename(tpath, remote)
+        with self._lock:
+            self.uploaded += size
+
+    def _same_prefix(self, src, tpath, offset, hobj):
+        # the remote part's bytes against the local file's first `offset`; reading them
+        # back is cheaper than uploading them again
+        with self.sftp().open(tpath, 'rb') as part:
+            part.prefetch(offset)
+            left = offset
+            while left > 0:
+                chunk = src.read(min(UPLOAD_CHUNK, left))
+                if not chunk or part.read(len(chunk)) != chunk:
+                    return False
+
+                hobj.update(chunk)
+                left -= len(chunk)
+
+        return True
+
+    def sync(self, local: Path, remote: str):
+        # for build artifacts that keep their mtime while unchanged (see build_pyz)
+        stat_ = local.stat()
+        try:
+            attr = self.sftp().stat(remote)
+        except IOError:
+            attr = None
+
+        if attr is not None and attr.st_size == stat_.st_size and attr.st_mtime == int(stat_.st_mtime):
+            return False
+
+        self.upload(local, remote)
+        self.sftp().utime(remote, (int(stat_.st_atime), int(stat_.st_mtime)))
+        return True
+
+    def exists(self, remote: str, size):
+        try:
+            attr = self.sftp().stat(remote)
+        except IOError:
+            return False
+
+        return stat.S_ISREG(attr.st_mode) and attr.st_size == size
+
+
+def plan(root: Path, remote: Publisher, site=SITE):
+    # (files, manifests): files the local manifests name that the remote manifests don't
+    # list with the same hash, and the manifests that changed (index.json last)
+    index = "packages/index.json"
+    local_index = json.loads((root / index).read_text(encoding='utf-8'))
+    remote_index = remote.read_json(index) or {}
+    local_packages = manifest_files(local_index, site)
+    remote_packages = manifest_files(remote_index, site)
+
+    local_files, remote_files, manifests = {}, {}, []
+    for rpath, sha1 in local_packages.items():
+        manifest = rpath + "modpack.json"  # package urls name the folder
+        files = manifest_files(json.loads((root / manifest).read_text(encoding='utf-8')), site)
+        local_files.update(files)
+        if remote_packages.get(rpath) == sha1:
+            remote_files.update(files)  # the same modpack.json is live, so is everything in it
+        else:
+            manifests.append(manifest)
+            remote_files.update(manifest_files(remote.read_json(manifest) or {}, site))
+
+    files = {rpath: sha1 for rpath, sha1 in local_files.items() if remote_files.get(rpath) != sha1}
+    if manifests or local_index != remote_index:
+        manifests.append(index)
+
+    return files, manifests
+
+
+def publish(root: Path, client_factory=connect, channels=CHANNELS, remote_root=REMOTE_ROOT, site=SITE):
+    import paramiko
+
+    root = Path(root)
+    # uploads survive reconnects and reruns until the local index changes
+    journal = UpdateJournal(root / '.publish.journal', calc_sha1_hash(root / 'packages' / 'index.json'))
+
+    with journal:
+        for attempt in range(RECONNECTS):
+            client = client_factory()
+            publisher = Publisher(client, remote_root, channels)
+            try:
+                return _publish(root, publisher, journal, site)
+            except (EOFError, OSError, paramiko.SSHException) as e:
+                print(f"W: connection dropped ({e!r}), resuming", flush=True)
+                time.sleep(min(30, 2 ** attempt))
+            finally:
+                publisher.close()
+                client.close()
+
+    raise Exception("publish failed")
+
+
+def _publish(root: Path, publisher: Publisher, journal: UpdateJournal, site):
+    started = time.monotonic()
+    files, manifests = plan(root, publisher, site)
+
+    def upload(rpath):
+        local = root / rpath
+        if journal.trusted(local, rpath):
+            return False
+
+        remote = publisher.remote_path(rpath)
+        # objects are content addressed and only ever appear through a rename
+        if not (rpath.startswith("objects/") and publisher.exists(remote, local.stat().st_size)):
+            publisher.upload(local, remote)
+
+        journal.record(FETCHED, local, rpath)
+        return True
+
+    pending = sorted(files, key=lambda rpath: -(root / rpath).stat().st_size)  # big ones first
+    with ThreadPoolExecutor(max_workers=publisher.channels) as executor:
+        done = sum(executor.map(upload, pending))
+
+    # a manifest is renamed into place only once everything it names is there;
+    # pre-compressed siblings follow their manifest, servers ignore stale ones
+    for rpath in sorted(manifests, key=lambda item: MANIFEST_NAMES.index(posixpath.basename(item))):
+        publisher.upload(root / rpath, publisher.remote_path(rpath))
+        for suffix in VARIANT_SUFFIXES:
+            variant = root / (rpath + suffix)
+            if variant.exists():
+                publisher.upload(variant, publisher.remote_path(rpath + suffix))
+
+    journal.remove()
+    elapsed = time.monotonic() - started
+    print(f"I: published {done} files and {len(manifests)} manifests, "
+          f"{publisher.uploaded / (1 << 20):.1f} MiB in {elapsed:.1f}s")
+    return done
+
+
+def publish_main(argv=None):
+    parser = argparse.ArgumentParser(prog="publish")
+    parser.add_argument("--root", default="web", help="local web root, built before publishing")
+    parser.add_argument("--channels", type=int, default=CHANNELS)
+    parser.add_argument("--key", default="ssh-rsa.key")
+    parser.add_argument("--no-build", action="store_true")
+    args = parser.parse_args(argv)
+
+    root = Path(args.root).resolve()
+    if not args.no_build:
+        build_main(["--root", str(root), "--site", SITE])
+
+    publish(root, lambda: connect(args.key), args.channels)
+
+
+if __name__ == '__main__':
+    publish_main()
@@ -0,0 +1,346 @@
+import argparse
+import asyncio
+import hashlib
+import socket
+from collections import OrderedDict, namedtuple
+from email.utils import formatdate
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+
+from nupdate import LAUNCHER_VERSION
+from nupdate.fileio import hash_file
+
+MANIFEST_NAMES = ("index.json", "modpack.json")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+VARIANTS = (("br", ".br"), ("gzip", ".gz"))
+SEND_CHUNK = 1 << 20
+MAX_HEADER = 64 << 10
+IDLE_TIMEOUT = 30
+
+Resource = namedtuple("Resource", "path content etag cache_control")
+
+REASONS = {
+    200: "OK",
+    206: "Partial Content",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    416: "Range Not Satisfiable",
+    503: "Service Unavailable",
+}
+
+
+class ManifestCache:
+    # hot manifests kept in memory, revalidated by (mtime, size)
+    def __init__(self, size=64):
+        self.size = size
+        self._entries = OrderedDict()
+
+    def get(self, path: Path):
+        stat = path.stat()
+        key = (stat.st_mtime_ns, stat.st_size)
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == key:
+            self._entries.move_to_end(path)
+            return entry[1], entry[2]
+
+        content = path.read_bytes()
+        etag = hashlib.sha1(content).hexdigest()
+        self._entries[path] = key, content, etag
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+        return content, etag
+
+
+class DigestCache:
+    # sha1 of the files served as they are on disk, for strong etags; keyed by
+    # (mtime, size), so a file rewritten in place gets a new one before its
+    # manifest is read again
+    def __init__(self, size=4096):
+        self.size = size
+        self._entries = OrderedDict()
+
+    def get(self, path: Path):
+        stat = path.stat()
+        key = (stat.st_mtime_ns, stat.st_size)
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == key:
+            self._entries.move_to_end(path)
+            return entry[1]
+
+        sha1 = hash_file(path, 'sha1')
+        if (path.stat().st_mtime_ns, path.stat().st_size) != key:
+            return None  # changed while hashed; the weak stat etag for this response
+
+        self._entries[path] = key, sha1
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+        return sha1
+
+
+class OriginServer:
+    variants = VARIANTS
+
+    def __init__(self, root: Path, prefix="/", cache_size=64):
+        self.root = Path(root).resolve()
+        self.prefix = prefix if prefix.endswith("/") else prefix + "/"
+        self.manifests = ManifestCache(cache_size)
+        self.digests = DigestCache()
+        self.requests = 0
+        self.address = None
+        self._sock = None
+
+    def listen(self, host, port):
+        server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            server_sock.bind((host, port))
+        except OSError:
+            server_sock.close()
+            raise
+
+        server_sock.listen(512)
+        server_sock.setblocking(False)
+        self.address = server_sock.getsockname()
+        self._sock = server_sock
+
+    async def serve(self, host, port):
+        self.listen(host, port)
+        await self.serve_forever()
+
+    async def serve_forever(self):
+        loop = asyncio.get_event_loop()
+        try:
+            while True:
+                sock, _ = await loop.sock_accept(self._sock)
+                sock.setblocking(False)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                loop.create_task(self._connection(sock))
+        finally:
+            self._sock.close()
+
+    async def _connection(self, sock):
+        loop = asyncio.get_event_loop()
+        buffer = b""
+        try:
+            while True:
+                while b"\r\n\r\n" not in buffer:
+                    if len(buffer) > MAX_HEADER:
+                        return
+
+                    data = await asyncio.wait_for(loop.sock_recv(sock, 65536), IDLE_TIMEOUT)
+                    if not data:
+                        return
+                    buffer += data
+
+                head, _, buffer = buffer.partition(b"\r\n\r\n")
+                keep_alive = await self._request(sock, head.decode('latin-1'))
+                if not keep_alive:
+                    return
+        except (asyncio.TimeoutError, ConnectionError, OSError):
+            pass
+        finally:
+            sock.close()
+
+    async def _request(self, sock, head):
+        self.requests += 1
+        lines = head.split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ", 2)
+        except ValueError:
+            await self._send(sock, 400, {}, b"", False)
+            return False
+
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" and (version == "HTTP/1.1" or connection == "keep-alive")
+
+        if method not in ("GET", "HEAD"):
+            await self._send(sock, 405, {"Allow": "GET, HEAD"}, b"", keep_alive)
+            return keep_alive
+
+        await self._get(sock, method, unquote(urlparse(target).path), headers, keep_alive)
+        return keep_alive
+
+    async def _resolve(self, url_path):
+        # url path => Resource, or None for a 404; subclasses map urls elsewhere
+        return await asyncio.get_event_loop().run_in_executor(None, self._lookup, url_path)
+
+    def _lookup(self, url_path):
+        # on an executor thread: stats, manifest reads and hashing stay off the loop
+        if not url_path.startswith(self.prefix):
+            return None
+
+        path = (self.root / url_path[len(self.prefix):]).resolve()
+        if path != self.root and self.root not in path.parents:
+            return None  # escapes the root
+
+        if path.is_dir():
+            path = next((path / name for name in MANIFEST_NAMES if (path / name).is_file()), None)
+            if path is None:
+                return None
+        elif not path.is_file():
+            return None
+
+        rpath = path.relative_to(self.root).as_posix()
+        if path.name in MANIFEST_NAMES:
+            content, etag = self.manifests.get(path)
+            return Resource(path, content, etag, REVALIDATE)
+        elif rpath.startswith("objects/"):
+            return Resource(path, None, path.name, IMMUTABLE)  # the name is the sha1
+
+        return Resource(path, None, self.digests.get(path), REVALIDATE)
+
+    def _select(self, path: Path, accept):
+        # => (path, stat, encoding): a pre-compressed sibling (file.br, file.gz) that is
+        # not older than the file when the client takes it, else the file itself
+        stat = path.stat()
+        for encoding, suffix in self.variants:
+            variant = path.with_name(path.name + suffix)
+            if encoding in accept and variant.is_file() and variant.stat().st_mtime_ns >= stat.st_mtime_ns:
+                return variant, variant.stat(), encoding
+
+        return path, stat, None
+
+    async def _get(self, sock, method, url_path, headers, keep_alive):
+        resource = await self._resolve(url_path)
+        if resource is None:
+            await self._send(sock, 404, {}, b"", keep_alive)
+            return
+
+        path, content, etag, cache_control = resource
+        content_type = "application/json" if path.suffix == ".json" else "application/octet-stream"
+        loop = asyncio.get_event_loop()
+        path, stat, encoding = await loop.run_in_executor(None, self._select, path, headers.get("accept-encoding", ""))
+        response = {
+            "Content-Type": content_type,
+            "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+            "Accept-Ranges": "bytes",
+            "Cache-Control": cache_control,
+        }
+
+        if encoding is not None:
+            content = None
+            response["Content-Encoding"] = encoding
+            etag = etag and f"{etag}-{encoding}"
+
+        if self.variants:
+            response["Vary"] = "Accept-Encoding"
+
+        response["ETag"] = f'"{etag}"' if etag else f'W/"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        if response["ETag"] in [tag.strip() for tag in headers.get("if-none-match", "").split(",")]:
+            await self._send(sock, 304, response, b"", keep_alive)
+            return
+
+        size = len(content) if content is not None else stat.st_size
+        status, start, end = 200, 0, size
+        range_header = headers.get("range")
+        if_range = headers.get("if-range")
+        # a weak etag never vouches for the bytes of a range
+        if range_header and (if_range is None or if_range == response["ETag"] and not if_range.startswith("W/")):
+            parsed = parse_range(range_header, size)
+            if parsed is False:
+                response["Content-Range"] = f"bytes */{size}"
+                await self._send(sock, 416, response, b"", keep_alive)
+                return
+            elif parsed is not None:
+                status, (start, end) = 206, parsed
+                response["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+
+        response["Content-Length"] = str(end - start)
+        if method == "HEAD":
+            await self._send(sock, status, response, b"", keep_alive, length_set=True)
+        elif content is not None:
+            await self._send(sock, status, response, content[start:end], keep_alive, length_set=True)
+        else:
+            await self._send(sock, status, response, b"", keep_alive, length_set=True)
+            await self._sendfile(sock, path, start, end - start)
+
+    async def _sendfile(self, sock, path: Path, offset, count):
+        # file bodies; subclasses shape or count them
+        await sendfile(sock, path, offset, count)
+
+    async def _send(self, sock, status, headers, body, keep_alive, length_set=False):
+        loop = asyncio.get_event_loop()
+        lines = [f"HTTP/1.1 {status} {REASONS[status]}", f"Server: nupdate/{LAUNCHER_VERSION}",
+                 f"Date: {formatdate(usegmt=True)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if not length_set:
+            headers = dict(headers, **{"Content-Length": str(len(body))})
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        await loop.sock_sendall(sock, ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body)
+
+
+async def sendfile(sock, path: Path, offset, count):
+    loop = asyncio.get_event_loop()
+    with path.open('rb') as fp:
+        if hasattr(loop, 'sock_sendfile'):
+            # zero-copy os.sendfile on unix loops, falls back to read/send elsewhere
+            await loop.sock_sendfile(sock, fp, offset, count)
+            return
+
+        fp.seek(offset)
+        while count > 0:
+            chunk = await loop.run_in_executor(None, fp.read, min(SEND_CHUNK, count))
+            if not chunk:
+                break
+            await loop.sock_sendall(sock, chunk)
+            count -= len(chunk)
+
+
+def parse_range(value, size):
+    # None: ignore (serve 200); False: unsatisfiable; else (start, end) end exclusive
+    unit, _, spec = value.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            length = int(last)
+            if length <= 0:
+                return False
+            start, end = max(size - length, 0), size
+        else:
+            start = int(first)
+            end = int(last) + 1 if last else size
+    except ValueError:
+        return None
+
+    end = min(end, size)
+    if start >= size or start >= end:
+        return False
+
+    return start, end
+
+
+def serve_main(argv=None):
+    parser = argparse.ArgumentParser(prog="serve")
+    parser.add_argument("--root", default="/home/signet/web/")
+    parser.add_argument("--prefix", default="/")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--cache", type=int, default=64, help="manifests kept in memory")
+    args = parser.parse_args(argv)
+
+    server = OriginServer(Path(args.root), args.prefix, args.cache)
+    print(f"serving {server.root} on http://{args.host}:{args.port}{server.prefix}")
+
+    loop = asyncio.get_event_loop()
+    try:
+        loop.run_until_complete(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.close()
+
+
+if __name__ == '__main__':
+    serve_main()
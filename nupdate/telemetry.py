@@ -0,0 +1,234 @@
+import argparse
+import datetime
+import json
+import math
+import os
+import platform
+import threading
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from socketserver import ThreadingMixIn
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
+
+REPORT_VERSION = 1
+REPORT_TIMEOUT = 3  # the player is never kept waiting on this
+MAX_REPORT = 64 << 10
+PERCENTILES = (50, 90, 99)
+
+if TYPE_CHECKING:
+    from nupdate.trace import Tracer
+
+
+# index.json "telemetry": "<url>" or {"url": "<url>"}; only used when options.txt
+# also has "telemetry": true
+def telemetry_url(index_value):
+    if isinstance(index_value, dict):
+        index_value = index_value.get("url")
+
+    return index_value if isinstance(index_value, str) and index_value else None
+
+
+def build_report(tracer: "Tracer", package, version, **fields):
+    # numbers only: no user names, tokens, paths or urls beyond mirror host names
+    from nupdate import LAUNCHER_VERSION
+    from nupdate.jvm import host_memory_mb
+    from nupdate.mirrors import get_usage
+
+    phases = defaultdict(float)
+    fetches = checks = passed = failed = downloaded = 0
+    policies = Counter()
+    for event in tracer.events if tracer is not None else ():
+        args = event.get("args", {})
+        if event["cat"] == "launch":
+            phases[event["name"]] += event["dur"] / 1e6
+        elif event["cat"] == "download":
+            fetches += 1
+            if "bytes" in args:
+                downloaded += args["bytes"]
+            else:
+                failed += 1
+        elif event["cat"] == "verify":
+            checks += 1
+            passed += bool(args.get("ok"))
+            policies[args.get("policy")] += 1
+
+    mirrors = Counter()
+    for base, served in get_usage().items():
+        mirrors[urlparse(base).netloc] += served
+
+    report = {
+        "v": REPORT_VERSION,
+        "launcher": LAUNCHER_VERSION,
+        "package": package,
+        "version": version,
+        "os": f"{platform.system()} {platform.release()}",
+        "ram_gb": round(host_memory_mb() / 1024),
+        "cores": os.cpu_count(),
+        "phases": {name: round(seconds, 3) for name, seconds in phases.items()},
+        "downloads": {"files": fetches, "bytes": downloaded, "failed": failed},
+        "verify": {"checked": checks, "policies": dict(policies)},
+        # files found in place and intact, out of all the launch needed
+        "cache_hit_rate": round(passed / (passed + fetches - failed), 4) if passed + fetches - failed else None,
+        "mirrors": dict(mirrors),
+    }
+    report.update(fields)
+    return report
+
+
+def send_report(url, report, timeout=REPORT_TIMEOUT):
+    from nupdate.utils import get_session
+
+    try:
+        req = get_session().post(url, json=report, timeout=timeout)
+        return 200 <= req.status_code < 300
+    except Exception:
+        return False
+
+
+def percentile(values, q):
+    # nearest rank
+    values = sorted(values)
+    if not values:
+        return None
+
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def distribution(values):
+    values = [value for value in values if value is not None]
+    summary = {f"p{q}": percentile(values, q) for q in PERCENTILES}
+    summary["n"] = len(values)
+    return summary
+
+
+def summarize(reports):
+    # {"<package> <version>": {launches, failures, phases: {name: {p50, p90, p99, n}}, ...}}
+    groups = defaultdict(list)
+    for report in reports:
+        groups[f"{report.get('package')} {report.get('version')}"].append(report)
+
+    summary = {}
+    for key, group in sorted(groups.items()):
+        phases = sorted({name for report in group for name in report.get("phases", {})})
+        mirrors = Counter()
+        for report in group:
+            mirrors.update(report.get("mirrors") or {})
+
+        summary[key] = {
+            "launches": len(group),
+            "failures": sum(1 for report in group if report.get("exit") not in (0, None)),
+            "phases": {
+                name: distribution([report.get("phases", {}).get(name) for report in group]) for name in phases
+            },
+            "total": distribution([sum(report.get("phases", {}).values()) for report in group]),
+            "download_bytes": distribution([report.get("downloads", {}).get("bytes") for report in group]),
+            "download_failures": sum(report.get("downloads", {}).get("failed", 0) for report in group),
+            "cache_hit_rate": distribution([report.get("cache_hit_rate") for report in group]),
+            "mirrors": dict(mirrors.most_common()),
+        }
+
+    return summary
+
+
+class ReportStore:
+    # one json line per report, one file per utc day: <root>/YYYY-MM-DD.jsonl
+    def __init__(self, root: Path):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def add(self, report):
+        self.root.mkdir(parents=True, exist_ok=True)
+        report = dict(report, received=datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"))
+        path = self.root / (report["received"][:10] + ".jsonl")
+        with self._lock, path.open('a', encoding='utf-8') as fp:
+            fp.write(json.dumps(report, sort_keys=True) + "\n")
+
+    def reports(self, days=None):
+        files = sorted(self.root.glob("*.jsonl")) if self.root.exists() else []
+        for path in files[-days:] if days else files:
+            with path.open('r', encoding='utf-8') as fp:
+                for line in fp:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+
+
+class CollectorHandler(BaseHTTPRequestHandler):
+    # POST <anything>: store a report; GET /summary: percentiles per package version
+    store: ReportStore = None
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            return self._reply(411, {"error": "length required"})
+
+        if not 0 < length <= MAX_REPORT:
+            return self._reply(413, {"error": "report too large"})
+
+        try:
+            report = json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError:
+            return self._reply(400, {"error": "not json"})
+
+        if not isinstance(report, dict) or report.get("v") != REPORT_VERSION:
+            return self._reply(400, {"error": "unknown report"})
+
+        self.store.add(report)
+        self._reply(204)
+
+    def do_GET(self):
+        if urlparse(self.path).path.rstrip("/") != "/summary":
+            return self._reply(404, {"error": "not found"})
+
+        self._reply(200, summarize(self.store.reports()))
+
+    def _reply(self, status, body=None):
+        content = json.dumps(body, indent=2).encode('utf-8') if body is not None else b""
+        self.send_response(status)
+        if content:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CollectorServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_collector(root: Path, host="127.0.0.1", port=0) -> CollectorServer:
+    handler = type("Handler", (CollectorHandler,), {"store": ReportStore(root)})
+    return CollectorServer((host, port), handler)
+
+
+def collect_main(argv=None):
+    parser = argparse.ArgumentParser(prog="build collect")
+    parser.add_argument("--root", default="/home/signet/telemetry/", help="where reports are kept")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--summary", action="store_true", help="print the summary of stored reports and exit")
+    parser.add_argument("--days", type=int, default=None, help="with --summary: only the last N days")
+    args = parser.parse_args(argv)
+
+    root = Path(args.root)
+    if args.summary:
+        print(json.dumps(summarize(ReportStore(root).reports(args.days)), indent=2))
+        return 0
+
+    server = make_collector(root, args.host, args.port)
+    print(f"I: collecting launch reports on {args.host}:{server.server_address[1]} into {root}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    return 0
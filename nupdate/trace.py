@@ -0,0 +1,188 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+PROFILE_TOP = 25  # rows of the profiled phase's stats in the summary
+
+
+class _NullSpan:
+    # what span() hands out while tracing is off: nothing is timed or stored
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = "tracer", "name", "cat", "args", "start", "profile"
+
+    def __init__(self, tracer: "Tracer", name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = None
+        self.profile = None
+
+    def __enter__(self):
+        if self.name == self.tracer.profile_phase:
+            self.profile = self.tracer.start_profile()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        end = time.perf_counter()
+        if self.profile is not None:
+            self.tracer.stop_profile(self.profile)
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.add(self, end)
+        return False
+
+    def set(self, **args):
+        # results known only at the end: bytes, counts
+        self.args.update(args)
+
+
+class Tracer:
+    # complete ("X") events in chrome's trace event format, one row per thread;
+    # load the file in chrome://tracing or https://ui.perfetto.dev
+    def __init__(self, profile_phase=None, output: Path = None):
+        self.profile_phase = profile_phase
+        self.output = output  # where the owner writes it when done; None keeps it in memory
+        self.origin = time.perf_counter()
+        self.events = []
+        self.profiler = None
+        self._profiling = False
+        self._lock = threading.Lock()
+
+    def span(self, name, cat, args):
+        return Span(self, name, cat, args)
+
+    def add(self, span: Span, end):
+        event = {
+            "name": span.name,
+            "cat": span.cat,
+            "ph": "X",
+            "ts": round((span.start - self.origin) * 1e6, 1),
+            "dur": round((end - span.start) * 1e6, 1),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        }
+        if span.args:
+            event["args"] = span.args
+
+        with self._lock:
+            self.events.append(event)
+
+    def start_profile(self):
+        import cProfile
+
+        with self._lock:
+            if self._profiling or self.profiler is not None:
+                return None  # the first run only; cProfile sees its own thread
+            self._profiling = True
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def stop_profile(self, profiler):
+        profiler.disable()
+        with self._lock:
+            self._profiling = False
+            self.profiler = profiler
+
+    def chrome_trace(self):
+        with self._lock:
+            events = list(self.events)
+
+        threads = {event["tid"] for event in events}
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid,
+             "args": {"name": names.get(tid, str(tid))}}
+            for tid in threads
+        ]
+        return {"traceEvents": metadata + sorted(events, key=lambda event: event["ts"]), "displayTimeUnit": "ms"}
+
+    def write(self, path: Path):
+        tpath = path.with_name(path.name + ".part")
+        tpath.write_text(json.dumps(self.chrome_trace()))
+        os.replace(str(tpath), str(path))
+
+        if self.profiler is not None:
+            self.profiler.dump_stats(str(path.with_suffix(".prof")))
+
+    def summary(self):
+        # per span name: calls, total, mean and max; spans on worker threads overlap,
+        # so totals of download/verify can exceed the wall time
+        with self._lock:
+            events = list(self.events)
+
+        wall = (time.perf_counter() - self.origin) * 1e3
+        rows = defaultdict(list)
+        for event in events:
+            rows[(event["cat"], event["name"])].append(event["dur"] / 1e3)
+
+        lines = [f"{'category':<10} {'span':<24} {'calls':>6} {'total ms':>10} {'mean ms':>9} {'max ms':>9} "
+                 f"{'wall':>6}"]
+        for (cat, name), durations in sorted(rows.items(), key=lambda item: -sum(item[1])):
+            total = sum(durations)
+            lines.append(f"{cat:<10} {name[:24]:<24} {len(durations):>6} {total:>10.1f} "
+                         f"{total / len(durations):>9.2f} {max(durations):>9.1f} {total / wall:>6.0%}")
+
+        lines.append(f"wall {wall:.1f} ms")
+        if self.profiler is not None:
+            lines.append("")
+            lines.append(self.profile_summary())
+
+        return "\n".join(lines)
+
+    def profile_summary(self):
+        import io
+        import pstats
+
+        stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stream).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        return f"profile of {self.profile_phase!r}:\n" + stream.getvalue().strip()
+
+
+_tracer: Tracer = None
+
+
+def span(name, cat="launch", **args):
+    tracer = _tracer
+    if tracer is None:
+        return NULL_SPAN
+
+    return tracer.span(name, cat, args)
+
+
+# options.txt "trace": true, or {"profile": "<span name>"} to run cProfile over that phase
+def enable(profile_phase=None, output: Path = None) -> Tracer:
+    global _tracer
+    _tracer = Tracer(profile_phase, output)
+    return _tracer
+
+
+def disable() -> Tracer:
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def get_tracer() -> Tracer:
+    return _tracer
@@ -1,4 +1,3 @@
-import base64
 import json
 import runpy
 import shutil
@@ -6,10 +5,10 @@ import sys
 from pathlib import Path
 from pprint import pprint
 
-import paramiko
 import requests
 
 from nupdate.build import build_pyz
+from nupdate.publish import Publisher, connect
 from nupdate.utils import calc_sha1_hash
 
 
@@ -41,22 +40,15 @@ pyz_path = build_pyz()
 assert pyz_path.exists()
 assert launcher_path.exists()
 
-# Note. this is not password
-server_auth_key = b'AAAAB3NzaC1yc2EAAAADAQABAAABAQDILRxAzEUdZZU9zNXJTF8L5UAuZKW0nsSF3yBfOM0U8bHt98Qa8v5FELRnbLYXcCK3x9UJ55O9U5VnX4tKEiSoXc3IoxfQrQfTuOpMJsvpAbfRrIFKSrRTBD3VoCWB4gBpuQEGzrhZW9VIV3nFiufuu0dMzmJyuPcWbYmoTlpAiyzs/68GuXW82DuPCv69X3LD2GCcSqZ6lA8P8JNwXuIbAEZMfBq/Ts8QV8TNHdV9uE/FjZa1a6vpporf+2C34Mk/pesqROBL2UsZUEDbL1S1kbHXwMr5Wn3q8tr+n+TRsYItRP0J7vjTdDbBcTrIAKCabCuwCTjLdD2j9dC/Mi47'
+client = connect()
 
-skey = paramiko.RSAKey(data=base64.b64decode(server_auth_key))
-
-key = paramiko.RSAKey(filename="ssh-rsa.key")
-
-client = paramiko.SSHClient()
-client.get_host_keys().add('mc.nyang.kr', 'ssh-rsa', skey)
-client.connect('mc.nyang.kr', username='signet', pkey=key)
-
-sftp: paramiko.SFTPClient = client.open_sftp()
-
-sftp.put(pyz_path, "/home/signet/.nupdate.pyz")
-# noinspection PyTypeChecker
-sftp.put(launcher_path, "/home/signet/web/launcher.zip")
+# atomic and resumable; package content goes through nupdate.publish
+publisher = Publisher(client)
+try:
+    publisher.sync(pyz_path, "/home/signet/.nupdate.pyz")
+    publisher.upload(launcher_path, "/home/signet/web/launcher.zip")
+finally:
+    publisher.close()
 
 stdin, stdout, stderr = client.exec_command("/home/signet/instance/etp/update-etp.sh")
 for line in stderr:
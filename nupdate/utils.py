@@ -1,97 +1,144 @@
 import copy
-import hashlib
 import json
+import os
 import tempfile
+import threading
 from collections import UserDict
 from contextlib import contextmanager
 from pathlib import Path
-from urllib.parse import urlparse
+from typing import TYPE_CHECKING
 
-import certifi
-import hyper.tls
-import progressbar
-import requests
-from hyper.contrib import HTTP20Adapter
+from nupdate.fileio import hash_file, stream_chunk_size
+from nupdate.hashes import HASH_ALGORITHMS, negotiate, strongest
+from nupdate.mirrors import with_mirrors
+from nupdate.trace import span
+from nupdate.verify import FULL_POLICY, SECTIONS, VerifyPolicy, check_archive, get_policy, is_archive
 
-hyper.tls.cert_loc = certifi.where()
+if TYPE_CHECKING:
+    import requests
 
 
-class ChunkTransferBar(progressbar.DataTransferBar):
-    def __next__(self):
-        try:
-            value = next(self._iterable)
-            if self.start_time is None:
-                self.start()
-            else:
-                self.update(self.value + len(value))
-            return value
-        except StopIteration:
-            self.finish()
-            raise
+def fetch(url, path):
+    def attempt(target):
+        return path.stat().st_size if fetch_interanl(target, path) else None
 
+    if not with_mirrors(url, attempt):
+        from nupdate.progress import get_progress
 
-def fetch(url, path):
-    for i in range(3):
-        if fetch_interanl(url, path):
-            break
-    else:
+        get_progress().fail()
         raise Exception("request failed. check your internet")
 
     return True
 
 
-_session: requests.Session = None
+# one session per thread; downloads run on a thread pool
+_local = threading.local()
+_sessions = []
+
 
+def get_session() -> "requests.Session":
+    session = getattr(_local, 'session', None)
+    if session is None:
+        import certifi
+        import hyper.tls
+        import requests
+        from hyper.contrib import HTTP20Adapter
 
-def get_session() -> requests.Session:
-    global _session
-    if _session is None:
-        _session = requests.Session()
-        _session.mount('https://mc.nyang.kr', HTTP20Adapter())
+        hyper.tls.cert_loc = certifi.where()
+
+        session = _local.session = requests.Session()
+        session.mount('https://mc.nyang.kr', HTTP20Adapter())
         # TODO: fix hard corded?
+        _sessions.append(session)
 
-    return _session
+    return session
 
 
 def clear_session():
-    global _session
-    sess, _session = _session, None
-    if sess is not None:
-        sess.close()
+    global _local
+    sessions = _sessions[:]
+    _sessions.clear()
+    _local = threading.local()
+    for sess in sessions:
+        for adapter in sess.adapters.values():
+            try:
+                adapter.close()
+            except AttributeError:
+                # hyper's HTTP20Adapter skips the pool manager HTTPAdapter.close() clears
+                for conn in getattr(adapter, 'connections', {}).values():
+                    conn.close()
 
 
 def fetch_interanl(url, path):
+    from nupdate.progress import get_progress
+
+    progress = get_progress()
     sess = get_session()
     req = sess.get(url, stream=True)
     if req.status_code != 200:
-        print('err', req.status_code, url)
+        progress.message('err', req.status_code, url)
         return False
 
-    with path.open('wb') as fp:
+    total_length = req.headers.get('content-length')
+    expected_size = int(total_length) if total_length else None
+    transfer = progress.begin(expected_size)
+    ok = False
+    try:
+        with path.open('wb') as fp:
+            for chunk in req.iter_content(chunk_size=stream_chunk_size(expected_size)):
+                fp.write(chunk)
+                transfer.update(len(chunk))
+
+        ok = True
+    finally:
+        transfer.finish(ok)
+
+    return True
+
+
+def fetch_bytes(url, start=None, end=None):
+    # returns (offset, content); offset is 0 when the server ignored the range
+    from nupdate.progress import get_progress
+
+    progress = get_progress()
+    headers = {}
+    if start is not None:
+        headers['Range'] = f'bytes={start}-{"" if end is None else end - 1}'
+
+    result = None
+
+    def attempt(target):
+        nonlocal result
+        req = get_session().get(target, headers=headers, stream=True)
+        if req.status_code not in (200, 206):
+            progress.message('err', req.status_code, target)
+            return None
+
         total_length = req.headers.get('content-length')
-        expected_size = int(total_length) if total_length else progressbar.UnknownLength
+        expected_size = int(total_length) if total_length else None
+        transfer = progress.begin(expected_size)
+        chunks = []
+        ok = False
+        try:
+            for chunk in req.iter_content(chunk_size=stream_chunk_size(expected_size)):
+                chunks.append(chunk)
+                transfer.update(len(chunk))
 
-        print(urlparse(url).path.rpartition('/')[2])
+            ok = True
+        finally:
+            transfer.finish(ok)
 
-        bar = ChunkTransferBar(
-            max_value=expected_size
-        )
+        result = (start or 0) if req.status_code == 206 else 0, b''.join(chunks)
+        return len(result[1])
 
-        for chunk in bar(req.iter_content(chunk_size=4096)):
-            fp.write(chunk)
+    if not with_mirrors(url, attempt):
+        raise Exception("request failed. check your internet")
 
-    return True
+    return result
 
 
 def calc_sha1_hash(path: Path):
-    with path.open('rb') as fp:
-        hobj = hashlib.sha1()
-        buf = True
-        while buf:
-            buf = fp.read(4096)
-            hobj.update(buf)
-
-    return hobj.hexdigest().lower()
+    return hash_file(path, 'sha1')
 
 
 @contextmanager
@@ -133,6 +180,9 @@ class Namespace(UserDict):
 
 
 class Fetchable:
+    # verify policy section, see nupdate.verify.SECTIONS
+    section = None
+
     @property
     def url(self) -> str:
         raise NotImplementedError
@@ -147,20 +197,23 @@ class Fetchable:
     def __call__(self, mc_basepath: Path = None):
         return self.download(mc_basepath)
 
-    def download(self, mc_basepath: Path = None):
+    def download(self, mc_basepath: Path = None, policy: VerifyPolicy = None):
         if mc_basepath is None:
             mc_basepath = self._get_default_basepath()
 
-        if not self.check(mc_basepath):
+        if not self.check(mc_basepath, policy):
             return self.fetch(mc_basepath)
 
         return True
 
-    def check(self, basepath: Path = None):
+    def check(self, basepath: Path = None, policy: VerifyPolicy = None):
         if basepath is None:
             basepath = self._get_default_basepath()
 
-        result = self._check(basepath / self.path)
+        if policy is None:
+            policy = get_policy(self.section)
+
+        result = self._check(basepath / self.path, policy)
         return result
 
     def fetch(self, mc_basepath: Path = None):
@@ -169,10 +222,20 @@ class Fetchable:
 
         path = mc_basepath / self.path
         path.parent.mkdir(parents=True, exist_ok=True)
-        result = self._fetch(path)
+
+        # write next to the target and rename, so a killed launcher never leaves a torn file;
+        # a name of its own per attempt, so two fetches of one file never share it. the part
+        # file is only created by _fetch, so one that wrote nothing never installs anything
+        with mktemp('.part', path.name + '.', str(path.parent)) as tpath:
+            with span("fetch", "download", path=str(self.path)) as fetch_span:
+                result = self._fetch(tpath)
+                if result and tpath.exists():
+                    fetch_span.set(bytes=tpath.stat().st_size)
+                    os.replace(str(tpath), str(path))
+
         return result
 
-    def _check(self, path: Path):
+    def _check(self, path: Path, policy: VerifyPolicy = FULL_POLICY):
         raise NotImplementedError
 
     def _fetch(self, path: Path, require_check=True):
@@ -181,23 +244,25 @@ class Fetchable:
             return False
 
         if require_check and not self._check(path):
-            print('hash mismatch', self.url)
+            from nupdate.progress import get_progress
+
+            get_progress().message('hash mismatch', self.url)
             path.unlink()
             return False
 
         return True
 
 
-class Sha1Fetchable(Fetchable):
+class HashFetchable(Fetchable):
     @property
-    def sha1(self) -> str:
+    def hashes(self) -> dict:
         raise NotImplementedError
 
     @property
     def size(self) -> int:
         raise NotImplementedError
 
-    def _check(self, path: Path):
+    def _check(self, path: Path, policy: VerifyPolicy = FULL_POLICY):
         if not path.exists():
             return False
 
@@ -207,16 +272,61 @@ class Sha1Fetchable(Fetchable):
             if path.stat().st_size != file_size:
                 return False
 
-        sha1_hash = self.sha1
-        if not sha1_hash:
-            # there is no hash, no way to vaild
+        if not policy.wants_hash():
             return True
 
-        file_sha1_hash = calc_sha1_hash(path)
-        return file_sha1_hash == sha1_hash.lower()
+        hashes = self.hashes
+        if hashes:
+            name = negotiate(hashes)
+            if name is None:
+                return False  # e.g. only blake3 listed and no blake3 here: nothing vouches for it
+            if hash_file(path, name) != hashes[name].lower():
+                return False
+        # else: there is no hash, no way to vaild
+
+        if policy.checks_archive and is_archive(path):
+            return check_archive(path)
+
+        return True
+
+    def _check_untrusted(self, path: Path):
+        # bytes from a lan peer: the strongest listed hash, never the cheapest negotiated one
+        hashes = self.hashes
+        name = strongest(hashes)
+        if name is None:
+            return False
+
+        size = self.size
+        if size is not None and path.stat().st_size != int(size):
+            return False
+
+        return hash_file(path, name) == hashes[name].lower()
+
+    def _fetch(self, path: Path, require_check=True):
+        # lan peers first; their bytes still have to match this (origin) manifest's hash
+        sha1 = self.hashes.get('sha1')
+        if sha1:
+            from nupdate.peer import fetch_from_peers
+
+            size = self.size
+            if fetch_from_peers(sha1, path, self._check_untrusted, int(size) if size is not None else None):
+                return True
 
+        return super()._fetch(path, require_check)
 
-class NSFileFetchable(Sha1Fetchable, Namespace):
+
+class Sha1Fetchable(HashFetchable):
+    @property
+    def sha1(self) -> str:
+        raise NotImplementedError
+
+    @property
+    def hashes(self):
+        sha1_hash = self.sha1
+        return {'sha1': sha1_hash} if sha1_hash else {}
+
+
+class NSFileFetchable(HashFetchable, Namespace):
     @property
     def url(self) -> str:
         return self['url']
@@ -229,6 +339,15 @@ class NSFileFetchable(Sha1Fetchable, Namespace):
     def sha1(self):
         return self.get('sha1')
 
+    @property
+    def hashes(self):
+        return {name: self[name] for name in HASH_ALGORITHMS if self.get(name)}
+
+    @property
+    def section(self):
+        section = self.path.partition('/')[0]
+        return section if section in SECTIONS else 'config'
+
     @property
     def size(self):
         return self.get('size')
@@ -0,0 +1,265 @@
+import os
+import random
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from nupdate.trace import span
+
+if TYPE_CHECKING:
+    from nupdate.journal import UpdateJournal
+
+STAT = "stat"
+SAMPLE = "sample"
+FULL = "full"
+PARANOID = "paranoid"
+
+# weakest first; escalation only moves right
+POLICIES = (STAT, SAMPLE, FULL, PARANOID)
+SECTIONS = ("mods", "config", "assets", "libraries", "runtime")
+ARCHIVE_SUFFIXES = (".jar", ".zip")
+
+VERIFY_WORKERS = min(32, (os.cpu_count() or 1) * 2)
+DOWNLOAD_WORKERS = 4
+
+DEFAULT_SAMPLE = 5  # percent of files hashed per launch
+WARM_POLICIES = {
+    "mods": SAMPLE,
+    "config": STAT,
+    "assets": SAMPLE,
+    "libraries": SAMPLE,
+    "runtime": STAT,
+}
+
+
+class VerifyPolicy:
+    __slots__ = "name", "sample"
+
+    def __init__(self, name, sample=DEFAULT_SAMPLE):
+        if name not in POLICIES:
+            raise ValueError(f"unknown verify policy {name!r} (expected one of {', '.join(POLICIES)})")
+
+        self.name = name
+        self.sample = float(sample)
+
+    def wants_hash(self):
+        if self.name == STAT:
+            return False
+        elif self.name == SAMPLE:
+            return random.random() * 100 < self.sample
+
+        return True
+
+    @property
+    def checks_archive(self):
+        return self.name == PARANOID
+
+    def at_least(self, name):
+        if POLICIES.index(self.name) >= POLICIES.index(name):
+            return self
+
+        return VerifyPolicy(name, self.sample)
+
+    def __repr__(self):
+        if self.name == SAMPLE:
+            return f"<{type(self).__name__}: {self.name} {self.sample:g}%>"
+
+        return f"<{type(self).__name__}: {self.name}>"
+
+
+FULL_POLICY = VerifyPolicy(FULL)
+
+_policies = {}
+
+
+# options.txt "verify" overrides the manifest's "verify", which overrides WARM_POLICIES;
+# both accept one policy name or a {section or "default": name} dict.
+def configure_policies(options=None, manifest=None, escalate=False):
+    options = options or {}
+    sample = options.get("verify_sample", DEFAULT_SAMPLE)
+
+    names = dict(WARM_POLICIES)
+    for source in manifest, options.get("verify"):
+        if not source:
+            continue
+
+        if isinstance(source, str):
+            source = {"default": source}
+
+        default = source.get("default")
+        for section in SECTIONS:
+            name = source.get(section, default)
+            if name:
+                names[section] = name
+
+    _policies.clear()
+    for section, name in names.items():
+        policy = VerifyPolicy(name, sample)
+        if escalate:
+            policy = policy.at_least(FULL)
+
+        _policies[section] = policy
+
+    return dict(_policies)
+
+
+def get_policy(section=None) -> VerifyPolicy:
+    # unconfigured callers (build tools, fresh fetches) keep the old full check
+    return _policies.get(section, FULL_POLICY)
+
+
+_trust = None
+
+
+# a resident launcher (nupdate.daemon) vouches for files it saw pass a check and has
+# not seen change since: trusted(path, sha1, policy) and verified(path, sha1, policy)
+def set_trust(trust):
+    global _trust
+    _trust = trust
+
+
+def get_trust():
+    return _trust
+
+
+def check_archive(path: Path):
+    try:
+        with zipfile.ZipFile(str(path)) as zf:
+            return zf.testzip() is None
+    except (zipfile.BadZipFile, OSError):
+        return False
+
+
+def is_archive(path: Path):
+    return path.suffix.lower() in ARCHIVE_SUFFIXES
+
+
+def _stat(entry):
+    fetchable, basepath = entry
+    try:
+        return os.stat(str(basepath / fetchable.path))
+    except OSError:
+        return None
+
+
+def unique_entries(entries):
+    # asset indexes map several names to one object: one entry per target path, or
+    # the pool would check and fetch the same file on several workers at once
+    seen = set()
+    unique = []
+    for fetchable, basepath in entries:
+        target = basepath / fetchable.path
+        if target not in seen:
+            seen.add(target)
+            unique.append((fetchable, basepath))
+
+    return unique
+
+
+def _entry_policy(fetchable, policy: VerifyPolicy = None, minimum=None):
+    entry_policy = policy if policy is not None else get_policy(fetchable.section)
+    if minimum is not None:
+        entry_policy = entry_policy.at_least(minimum)
+
+    return entry_policy
+
+
+# entries are (fetchable, basepath) pairs; returns the ones that need a fetch.
+# entries the journal already vouches for are skipped, passed ones are recorded.
+# entries checked with a full (or stronger) policy that passed are appended to `verified`,
+# as are skipped ones the journal saw fetched or fully checked.
+def verify_entries(entries, policy: VerifyPolicy = None, minimum=None, workers=None,
+                   journal: "UpdateJournal" = None, verified: list = None):
+    entries = unique_entries(entries)
+    workers = workers or VERIFY_WORKERS
+
+    if journal is not None:
+        unchecked = []
+        for fetchable, basepath in entries:
+            if not journal.trusted(basepath / fetchable.path, fetchable.path):
+                unchecked.append((fetchable, basepath))
+            elif verified is not None and journal.fully_checked(fetchable.path):
+                verified.append((fetchable, basepath))
+        entries = unchecked
+
+    trust = _trust
+    if trust is not None:
+        entries = [
+            (fetchable, basepath) for fetchable, basepath in entries
+            if not trust.trusted(basepath / fetchable.path, getattr(fetchable, 'sha1', None),
+                                 _entry_policy(fetchable, policy, minimum))
+        ]
+
+    def check(entry):
+        fetchable, basepath = entry
+        entry_policy = _entry_policy(fetchable, policy, minimum)
+        full = entry_policy.at_least(FULL) is entry_policy
+        with span("check", "verify", path=str(fetchable.path), policy=entry_policy.name) as check_span:
+            ok = fetchable.check(basepath, entry_policy)
+            check_span.set(ok=ok)
+        if ok and journal is not None:
+            from nupdate.journal import VERIFIED
+            journal.record(VERIFIED, basepath / fetchable.path, fetchable.path, full)
+
+        if ok and trust is not None:
+            trust.verified(basepath / fetchable.path, getattr(fetchable, 'sha1', None), entry_policy)
+
+        if ok and verified is not None and full:
+            verified.append(entry)
+
+        return ok
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        stats = list(executor.map(_stat, entries))
+
+        # missing files still go through check(): it fails them without reading anything,
+        # and passes fetchables that keep nothing on disk (forge's maven entries)
+        ordered = [entry for entry, stat in zip(entries, stats) if stat is None]
+
+        # inode order roughly follows on-disk order, which keeps hdd seeks short
+        present = sorted(
+            ((stat.st_dev, stat.st_ino), index)
+            for index, stat in enumerate(stats) if stat is not None
+        )
+        ordered += [entries[index] for _, index in present]
+        repairs = [entry for entry, ok in zip(ordered, executor.map(check, ordered)) if not ok]
+
+    return repairs
+
+
+def download_entries(entries, workers=None, journal: "UpdateJournal" = None):
+    from nupdate.progress import get_progress
+
+    entries = unique_entries(entries)
+    if not entries:
+        return True
+
+    progress = get_progress()
+    progress.expect(len(entries), sum(int(getattr(fetchable, 'size', None) or 0) for fetchable, _ in entries))
+
+    def fetch(entry):
+        fetchable, basepath = entry
+        ok = fetchable.fetch(basepath)
+        if ok and journal is not None:
+            from nupdate.journal import FETCHED
+            journal.record(FETCHED, basepath / fetchable.path, fetchable.path)
+
+        trust = _trust
+        if ok and trust is not None:
+            trust.verified(basepath / fetchable.path, getattr(fetchable, 'sha1', None), FULL_POLICY)
+
+        return ok
+
+    with ThreadPoolExecutor(max_workers=workers or DOWNLOAD_WORKERS) as executor:
+        results = list(executor.map(fetch, entries))
+
+    return all(results)
+
+
+def repair_entries(entries, policy: VerifyPolicy = None, minimum=None, journal: "UpdateJournal" = None):
+    repairs = verify_entries(entries, policy, minimum, journal=journal)
+    if not download_entries(repairs, journal=journal):
+        raise Exception("repair failed")
+
+    return repairs
@@ -0,0 +1,292 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+# close_write rather than modify: an sftp upload is one event, not one per chunk
+WATCH_MASK = (IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF)
+EVENT_HEADER = struct.Struct("iIII")
+
+POLL_INTERVAL = 2.0
+DEBOUNCE = 2.0  # quiet time before a rebuild
+MAX_DELAY = 30.0  # rebuild anyway once changes have waited this long
+UPLOAD_SUFFIXES = (".filepart", ".part", ".tmp")  # sftp clients' in-progress names
+
+
+class InotifyWatcher:
+    # recursive: every directory below root gets a watch, new ones as they appear
+    def __init__(self, root: Path):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = ctypes.c_int, ctypes.c_int
+
+        self.root = root
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.watches = {}
+        self._add_tree(root)
+
+    def _add(self, path: Path):
+        wd = self._add_watch(self.fd, os.fsencode(str(path)), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            if errno == 28:  # ENOSPC: fs.inotify.max_user_watches
+                raise OSError(errno, "out of inotify watches")
+            return  # gone already
+
+        self.watches[wd] = path
+
+    def _add_tree(self, path: Path):
+        self._add(path)
+        for dirpath, dirnames, _ in os.walk(str(path)):
+            for dirname in dirnames:
+                self._add(Path(dirpath) / dirname)
+
+    def _remove_tree(self, path: Path):
+        # a directory moved away keeps its watches, which would report under its old path;
+        # deleted ones need none of this, the kernel drops their watches (IN_IGNORED)
+        for wd, watched in list(self.watches.items()):
+            if watched == path or path in watched.parents:
+                self._rm_watch(self.fd, wd)
+                del self.watches[wd]
+
+    def poll(self, timeout):
+        # changed paths; the root itself when events were lost
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        changed = set()
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return changed
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                changed.add(self.root)
+                continue
+
+            parent = self.watches.get(wd)
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+
+            if parent is None:
+                continue
+
+            path = parent / os.fsdecode(name) if name else parent
+            if mask & IN_ISDIR and mask & IN_MOVED_FROM:
+                self._remove_tree(path)
+            elif mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self._add_tree(path)
+
+            changed.add(path)
+
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    # where inotify is missing (not linux, or no watches left): compare stat snapshots
+    def __init__(self, root: Path, interval=POLL_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for dirpath, dirnames, filenames in os.walk(str(self.root)):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = stat.st_size, stat.st_mtime_ns
+
+        return snapshot
+
+    def poll(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        snapshot = self._scan()
+        changed = {
+            Path(path) for path in snapshot.keys() | self._snapshot.keys()
+            if snapshot.get(path) != self._snapshot.get(path)
+        }
+        self._snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+def make_watcher(root: Path, interval=POLL_INTERVAL):
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(root)
+        except (OSError, AttributeError):
+            pass
+
+    return PollingWatcher(root, interval)
+
+
+class BuildWatcher:
+    # keeps the packages and their digests in memory; a change under <package>/files,
+    # info.txt or minecraft.json rebuilds that package and then index.json
+    def __init__(self, path: Path, url_builder, store=None, log=print):
+        from nupdate.build import DigestCache
+
+        self.path = path
+        self.url_builder = url_builder
+        self.store = store
+        self.log = log
+        self.cache = DigestCache()
+        self.packages = {}
+        self._own = {}  # files the build itself rewrites => their mtime after it did
+
+    def package_of(self, changed: Path):
+        # package folder name, "" for index-only changes, None when irrelevant
+        if changed == self.path:
+            return "*"
+
+        try:
+            parts = changed.relative_to(self.path).parts
+        except ValueError:
+            return None
+
+        if len(parts) == 1:
+            if parts[0] == "mirrors.txt":
+                return ""
+            return parts[0] if (self.path / parts[0]).is_dir() or parts[0] in self.packages else None
+
+        if parts[1] == "files" or (len(parts) == 2 and parts[1] in ("info.txt", "minecraft.json")):
+            if changed.name.endswith(UPLOAD_SUFFIXES):
+                return None
+
+            try:
+                if self._own.get(changed) == changed.stat().st_mtime_ns:
+                    return None  # our own write
+            except OSError:
+                pass
+
+            return parts[0]
+
+        return None
+
+    def busy(self, folder: Path):
+        return any(path.name.endswith(UPLOAD_SUFFIXES) for path in (folder / "files").rglob("*"))
+
+    def rebuild(self, names):
+        from nupdate.build import build_folder, build_index
+
+        done = set()
+        for name in sorted(names):
+            folder = self.path / name
+            pkg_id = name.lower()
+            if not folder.is_dir():
+                self.packages.pop(pkg_id, None)
+                self.cache.forget(folder)
+                self.log(f"I: package {pkg_id} removed")
+                done.add(name)
+                continue
+
+            if self.busy(folder):
+                self.log(f"I: package {pkg_id} has uploads in progress, waiting")
+                continue
+
+            start = time.monotonic()
+            try:
+                self.packages[pkg_id] = build_folder(folder, self.url_builder, self.store, self.cache)
+            except Exception as e:
+                self.log(f"E: package {pkg_id} failed to build: {e!r}")
+                done.add(name)  # retried on its next change
+                continue
+
+            for own in folder / "info.txt", folder / "minecraft.json":
+                if own.exists():
+                    self._own[own] = own.stat().st_mtime_ns
+
+            self.log(f"I: package {pkg_id} {self.packages[pkg_id].get('version')} "
+                     f"built in {time.monotonic() - start:.2f}s")
+            done.add(name)
+
+        result = build_index(self.path, self.url_builder, self.packages)
+        return done, result
+
+    def build_all(self):
+        names = {folder.name for folder in self.path.iterdir() if folder.is_dir()}
+        return self.rebuild(names)
+
+    def run(self, watcher=None):
+        _, result = self.build_all()
+        self.log("I: index", result['url'])
+
+        watcher = watcher or make_watcher(self.path)
+        self.log(f"I: watching {self.path} ({type(watcher).__name__})")
+
+        dirty, first, last = set(), None, None
+        try:
+            while True:
+                for changed in watcher.poll(DEBOUNCE / 2):
+                    name = self.package_of(changed)
+                    if name is None:
+                        continue
+
+                    if name == "*":
+                        dirty.update(folder.name for folder in self.path.iterdir() if folder.is_dir())
+                    elif name:
+                        dirty.add(name)
+                    else:
+                        dirty.add("")
+
+                    now = time.monotonic()
+                    first, last = first or now, now
+
+                if not dirty:
+                    continue
+
+                now = time.monotonic()
+                if now - last < DEBOUNCE and now - first < MAX_DELAY:
+                    continue
+
+                done, result = self.rebuild(dirty - {""})
+                dirty -= done | {""}
+                first = last = now if dirty else None
+                self.log("I: index", result['url'], result.get('sha1'))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()